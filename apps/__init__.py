@@ -0,0 +1,4 @@
+"""
+AI Forge - Applications Package
+Aplicaciones especializadas construidas sobre el núcleo de AI Forge
+"""
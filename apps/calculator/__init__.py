@@ -0,0 +1,3 @@
+"""
+AI Forge - Calculator App Package
+"""
@@ -3,18 +3,23 @@ AI Forge - Calculator App
 Aplicación especializada para cálculos matemáticos con IA
 """
 
-import sys
 import os
+import sys
+import gzip
+import hashlib
 
-# Agregar el directorio raíz al path para importar core
-sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
-
-from fastapi import HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import Body, HTTPException, Request
+from fastapi.responses import HTMLResponse, Response
+from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Dict, Any, Tuple
 from core.base_app import BaseAIApp
 
+try:
+    import brotli
+except ImportError:  # Brotli es opcional: sin él se sirve gzip
+    brotli = None
+
 
 class CalculationRequest(BaseModel):
     problem: str
@@ -22,13 +27,20 @@ class CalculationRequest(BaseModel):
     precision: Optional[int] = None
 
 
-# Configuración específica para calculadora
-CALCULATOR_CONFIG = {
-    "app_name": "Calculator AI",
-    "default_provider": "ollama",
-    "default_model": "llama3.2",
-    "temperature": 0.1,  # Baja temperatura para mayor precisión
-    "system_prompt": """Eres una calculadora AI experta en matemáticas. 
+# Esquema documentado de /calculate (el endpoint recibe el cuerpo como dict)
+_CALCULATE_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": CalculationRequest.model_json_schema()}
+        }
+    }
+}
+
+
+# Prompt del sistema: un único objeto str compartido (internado) que la
+# configuración referencia en lugar de copiar
+_SYSTEM_PROMPT = sys.intern("""Eres una calculadora AI experta en matemáticas. 
 
 INSTRUCCIONES:
 - Resuelve problemas matemáticos paso a paso
@@ -42,19 +54,24 @@ INSTRUCCIONES:
 FORMATO DE RESPUESTA:
 📊 **Problema:** [repite el problema]
 🔢 **Respuesta:** [resultado final]
-📝 **Explicación:** [pasos si es necesario]""",
+📝 **Explicación:** [pasos si es necesario]""")
+
+# Configuración específica para calculadora
+CALCULATOR_CONFIG = {
+    "app_name": "Calculator AI",
+    "default_provider": "ollama",
+    "default_model": "llama3.2",
+    "temperature": 0.1,  # Baja temperatura para mayor precisión
+    "system_prompt": _SYSTEM_PROMPT,
     "max_tokens": 1000,
     "stream": True
 }
 
 
-def setup_calculator_routes(app: BaseAIApp):
-    """Configura rutas específicas para la calculadora"""
-    
-    @app.app.get("/", response_class=HTMLResponse)
-    async def calculator_home():
-        """Página principal de la calculadora"""
-        html_content = """
+CALCULATOR_STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+# Página principal: solo se conserva su versión codificada (y precomprimida)
+_CALC_HTML_BYTES = """
 <!DOCTYPE html>
 <html lang="es">
 <head>
@@ -62,174 +79,8 @@ def setup_calculator_routes(app: BaseAIApp):
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>🧮 Calculator AI - AI Forge</title>
     <link rel="icon" href="data:image/svg+xml,<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 100 100'><text y='.9em' font-size='90'>🧮</text></svg>" />
-    <style>
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-        
-        body {
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            color: #333;
-            padding: 20px;
-        }
-        
-        .container {
-            max-width: 800px;
-            margin: 0 auto;
-            background: white;
-            border-radius: 20px;
-            box-shadow: 0 20px 40px rgba(0,0,0,0.1);
-            overflow: hidden;
-        }
-        
-        .header {
-            background: linear-gradient(45deg, #FF6B6B, #4ECDC4);
-            color: white;
-            padding: 30px;
-            text-align: center;
-        }
-        
-        .header h1 {
-            font-size: 2.5rem;
-            margin-bottom: 10px;
-        }
-        
-        .header p {
-            font-size: 1.1rem;
-            opacity: 0.9;
-        }
-        
-        .calculator {
-            padding: 40px;
-        }
-        
-        .input-section {
-            margin-bottom: 30px;
-        }
-        
-        .input-section label {
-            display: block;
-            font-weight: 600;
-            margin-bottom: 10px;
-            color: #555;
-        }
-        
-        .problem-input {
-            width: 100%;
-            padding: 15px;
-            border: 2px solid #e1e5e9;
-            border-radius: 10px;
-            font-size: 1.1rem;
-            transition: border-color 0.3s ease;
-        }
-        
-        .problem-input:focus {
-            outline: none;
-            border-color: #667eea;
-            box-shadow: 0 0 0 3px rgba(102, 126, 234, 0.1);
-        }
-        
-        .options {
-            display: flex;
-            gap: 20px;
-            margin: 20px 0;
-            align-items: center;
-        }
-        
-        .checkbox-group {
-            display: flex;
-            align-items: center;
-            gap: 8px;
-        }
-        
-        .calculate-btn {
-            background: linear-gradient(45deg, #667eea, #764ba2);
-            color: white;
-            border: none;
-            padding: 15px 30px;
-            font-size: 1.1rem;
-            font-weight: 600;
-            border-radius: 10px;
-            cursor: pointer;
-            transition: transform 0.2s ease;
-            width: 100%;
-        }
-        
-        .calculate-btn:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 10px 20px rgba(102, 126, 234, 0.3);
-        }
-        
-        .calculate-btn:disabled {
-            opacity: 0.6;
-            cursor: not-allowed;
-            transform: none;
-        }
-        
-        .result-section {
-            margin-top: 30px;
-            min-height: 200px;
-        }
-        
-        .result {
-            background: #f8f9fa;
-            border-radius: 10px;
-            padding: 20px;
-            border-left: 4px solid #667eea;
-        }
-        
-        .result.loading {
-            text-align: center;
-            color: #666;
-        }
-        
-        .spinner {
-            display: inline-block;
-            width: 20px;
-            height: 20px;
-            border: 3px solid #f3f3f3;
-            border-top: 3px solid #667eea;
-            border-radius: 50%;
-            animation: spin 1s linear infinite;
-            margin-right: 10px;
-        }
-        
-        @keyframes spin {
-            0% { transform: rotate(0deg); }
-            100% { transform: rotate(360deg); }
-        }
-        
-        .examples {
-            background: #f8f9fa;
-            border-radius: 10px;
-            padding: 20px;
-            margin-top: 20px;
-        }
-        
-        .examples h3 {
-            color: #333;
-            margin-bottom: 15px;
-        }
-        
-        .example-item {
-            background: white;
-            padding: 10px 15px;
-            margin: 8px 0;
-            border-radius: 6px;
-            cursor: pointer;
-            transition: background-color 0.2s ease;
-            border: 1px solid #e1e5e9;
-        }
-        
-        .example-item:hover {
-            background-color: #e3f2fd;
-            border-color: #667eea;
-        }
-    </style>
+    <link rel="stylesheet" href="/calculator/static/calculator.css">
+    <script src="/calculator/static/calculator.js" defer></script>
 </head>
 <body>
     <div class="container">
@@ -284,149 +135,119 @@ def setup_calculator_routes(app: BaseAIApp):
             </div>
         </div>
     </div>
+</body>
+</html>
+""".encode("utf-8")
 
-    <script>
-        let isCalculating = false;
 
-        function setExample(text) {
-            document.getElementById('problem').value = text;
+def _build_html_variants(html_bytes: bytes) -> Dict[str, Tuple[bytes, Dict[str, str]]]:
+    """Precomprime la página una sola vez para cada Content-Encoding soportado"""
+    digest = hashlib.md5(html_bytes).hexdigest()
+    bodies = {
+        "identity": html_bytes,
+        "gzip": gzip.compress(html_bytes, compresslevel=9, mtime=0)
+    }
+    if brotli is not None:
+        bodies["br"] = brotli.compress(html_bytes, quality=11)
+    
+    variants = {}
+    for encoding, body in bodies.items():
+        headers = {
+            "Cache-Control": "public, max-age=3600",
+            "ETag": f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"',
+            "Vary": "Accept-Encoding"
         }
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        variants[encoding] = (body, headers)
+    return variants
+
+
+def _select_encoding(accept_encoding: str) -> str:
+    """Elige la mejor variante precomprimida aceptada por el cliente"""
+    if "br" in accept_encoding and "br" in _CALC_HTML_VARIANTS:
+        return "br"
+    if "gzip" in accept_encoding:
+        return "gzip"
+    return "identity"
+
+
+_CALC_HTML_VARIANTS = _build_html_variants(_CALC_HTML_BYTES)
+
+
+async def _calculator_home(request: Request):
+    """Página principal de la calculadora"""
+    encoding = _select_encoding(request.headers.get("accept-encoding", ""))
+    body, headers = _CALC_HTML_VARIANTS[encoding]
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(
+        content=body,
+        media_type="text/html; charset=utf-8",
+        headers=headers
+    )
 
-        async function calculate() {
-            const problemInput = document.getElementById('problem');
-            const showSteps = document.getElementById('show-steps').checked;
-            const resultDiv = document.getElementById('result');
-            const calculateBtn = document.querySelector('.calculate-btn');
-            
-            const problem = problemInput.value.trim();
-            
-            if (!problem) {
-                alert('Por favor, ingresa un problema matemático');
-                return;
-            }
-            
-            if (isCalculating) return;
-            
-            isCalculating = true;
-            calculateBtn.disabled = true;
-            calculateBtn.textContent = '🤔 Calculando...';
-            
-            // Mostrar loading
-            resultDiv.innerHTML = `
-                <div class="result loading">
-                    <div class="spinner"></div>
-                    Resolviendo problema matemático...
-                </div>
-            `;
-            
-            try {
-                const response = await fetch('/chat', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify({
-                        message: problem,
-                        stream: true
-                    })
-                });
-                
-                if (!response.ok) {
-                    throw new Error('Error en la respuesta del servidor');
-                }
-                
-                // Leer respuesta streaming
-                const reader = response.body.getReader();
-                const decoder = new TextDecoder();
-                let fullResponse = '';
-                
-                resultDiv.innerHTML = '<div class="result"></div>';
-                const resultContent = resultDiv.querySelector('.result');
-                
-                while (true) {
-                    const { value, done } = await reader.read();
-                    if (done) break;
-                    
-                    const chunk = decoder.decode(value);
-                    const lines = chunk.split('\n');
-                    
-                    for (const line of lines) {
-                        if (line.startsWith('data: ')) {
-                            try {
-                                const data = JSON.parse(line.slice(6));
-                                if (data.response) {
-                                    fullResponse += data.response;
-                                    resultContent.innerHTML = formatMathResponse(fullResponse);
-                                }
-                                if (data.done) {
-                                    break;
-                                }
-                            } catch (e) {
-                                // Ignorar errores de parsing
-                            }
-                        }
-                    }
-                }
-                
-            } catch (error) {
-                resultDiv.innerHTML = `
-                    <div class="result" style="border-left-color: #ff6b6b;">
-                        <strong>❌ Error:</strong> ${error.message}
-                    </div>
-                `;
-            } finally {
-                isCalculating = false;
-                calculateBtn.disabled = false;
-                calculateBtn.textContent = '🔢 Calcular';
-            }
-        }
 
-        function formatMathResponse(text) {
-            // Convertir markdown básico a HTML
-            return text
-                .replace(/\\*\\*(.*?)\\*\\*/g, '<strong>$1</strong>')
-                .replace(/\\*(.*?)\\*/g, '<em>$1</em>')
-                .replace(/`(.*?)`/g, '<code>$1</code>')
-                .replace(/\n/g, '<br>')
-                .replace(/📊/g, '<span style=\"color: #4ECDC4;\">📊</span>')
-                .replace(/🔢/g, '<span style=\"color: #FF6B6B;\">🔢</span>')
-                .replace(/📝/g, '<span style=\"color: #667eea;\">📝</span>');
+async def _calculate_problem(http_request: Request, body: Dict[str, Any] = Body(...)):
+    """Endpoint específico para cálculos matemáticos"""
+    # El cuerpo se lee como dict: solo se usan dos campos y se validan aquí,
+    # sin pasar por el modelo pydantic completo (que queda para OpenAPI)
+    problem = body.get("problem")
+    if not isinstance(problem, str):
+        raise HTTPException(status_code=422, detail="Field 'problem' must be a string")
+    show_steps = body.get("show_steps", True)
+    
+    ai_app = http_request.app.state.ai_app
+    state = http_request.app.state
+    
+    try:
+        # El proveedor se resuelve una sola vez, en la primera petición (puede
+        # no estar disponible todavía al registrar las rutas). Los valores de
+        # configuración se siguen leyendo por petición porque /config y
+        # /prompts/use pueden cambiarlos en caliente.
+        provider = getattr(state, "calculator_provider", None)
+        if provider is None:
+            provider = state.calculator_provider = ai_app.providers.get_provider("ollama")
+        
+        # Enviar al sistema de chat con el prompt especializado (los
+        # ejemplos repetidos se sirven desde la caché del proveedor)
+        response = await provider.chat_cached(
+            message=problem,
+            model=ai_app.config.get("default_model"),
+            system_prompt=ai_app.config.get("system_prompt"),
+            temperature=ai_app.config.get("temperature", 0.1),
+            stream=False
+        )
+        
+        return {
+            "problem": problem,
+            "solution": response,
+            "show_steps": show_steps
         }
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        // Permitir envío con Enter (Ctrl+Enter para nueva línea)
-        document.getElementById('problem').addEventListener('keydown', function(e) {
-            if (e.key === 'Enter' && !e.ctrlKey) {
-                e.preventDefault();
-                calculate();
-            }
-        });
-    </script>
-</body>
-</html>
-        """
-        return HTMLResponse(content=html_content)
+
+def setup_calculator_routes(app: BaseAIApp):
+    """Configura rutas específicas para la calculadora"""
     
-    @app.app.post("/calculate")
-    async def calculate_problem(request: CalculationRequest):
-        """Endpoint específico para cálculos matemáticos"""
-        try:
-            # Enviar al sistema de chat con el prompt especializado
-            response = await app.providers.get_provider("ollama").chat(
-                message=request.problem,
-                model=app.config.get("default_model"),
-                system_prompt=app.config.get("system_prompt"),
-                temperature=app.config.get("temperature", 0.1),
-                stream=False
-            )
-            
-            return {
-                "problem": request.problem,
-                "solution": response,
-                "show_steps": request.show_steps
-            }
-            
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+    # CSS/JS servidos por StaticFiles (ETag, 304 y sendfile incluidos)
+    app.app.mount(
+        "/calculator/static",
+        StaticFiles(directory=CALCULATOR_STATIC_DIR),
+        name="calculator_static"
+    )
+    
+    app.app.add_api_route(
+        "/", _calculator_home, methods=["GET"],
+        response_class=HTMLResponse, name="calculator_home"
+    )
+    app.app.add_api_route(
+        "/calculate", _calculate_problem, methods=["POST"],
+        name="calculate_problem",
+        openapi_extra=_CALCULATE_OPENAPI
+    )
 
 
 # Crear la aplicación
@@ -436,6 +257,6 @@ def create_app():
     return app
 
 
-# Para importar desde run.py
+# Instancia única importada por uvicorn como "apps.calculator.main:app"
 app_instance = create_app()
 app = app_instance.get_app()
\ No newline at end of file
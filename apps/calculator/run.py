@@ -2,22 +2,49 @@
 """
 AI Forge - Calculator App Runner
 Ejecuta la aplicación especializada de calculadora matemática
+
+Por defecto arranca en modo producción (uvloop + httptools, sin recarga).
+Con DEV=1 arranca con recarga automática.
+
+Usa un único worker salvo que WEB_CONCURRENCY indique otro número: prompts y
+configuración se guardan en memoria de cada proceso y se escriben completos
+a disco, así que varios workers se sobrescribirían los cambios entre sí.
 """
 
+import os
+import importlib.util
 import uvicorn
-from main import app
+
+# Raíz del repositorio, para que uvicorn pueda importar el paquete "apps"
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+
+
+def _has_module(name: str) -> bool:
+    """Indica si un módulo opcional está instalado"""
+    return importlib.util.find_spec(name) is not None
+
 
 if __name__ == "__main__":
+    dev_mode = os.getenv("DEV") == "1"
+    workers = 1 if dev_mode else int(os.getenv("WEB_CONCURRENCY") or 1)
+    
     print("🧮 Starting Calculator AI...")
     print("📐 Specialized mathematical problem solver")
     print("🔗 Open http://localhost:8001 in your browser")
     print("💡 Examples: equations, derivatives, integrals, conversions")
+    print(f"⚙️ Mode: {'development (reload)' if dev_mode else f'production ({workers} workers)'}")
     print("=" * 50)
     
+    # Solo se pasa la cadena de importación: cada worker construye su propia
+    # app al importarla (no se abren sockets al importar, así que es seguro)
     uvicorn.run(
-        "main:app", 
+        "apps.calculator.main:app", 
+        app_dir=ROOT_DIR,
         host="0.0.0.0", 
         port=8001, 
-        reload=True,
+        reload=dev_mode,
+        workers=workers,
+        loop="uvloop" if _has_module("uvloop") else "asyncio",
+        http="httptools" if _has_module("httptools") else "h11",
         log_level="info"
-    )
\ No newline at end of file
+    )
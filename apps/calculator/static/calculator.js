@@ -0,0 +1,140 @@
+let isCalculating = false;
+
+function setExample(text) {
+    document.getElementById('problem').value = text;
+}
+
+// TransformStream que reagrupa el texto recibido en líneas completas
+function splitLines() {
+    let buffer = '';
+    return new TransformStream({
+        transform(chunk, controller) {
+            buffer += chunk;
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            for (const line of lines) {
+                controller.enqueue(line);
+            }
+        },
+        flush(controller) {
+            if (buffer) controller.enqueue(buffer);
+        }
+    });
+}
+
+async function calculate() {
+    const problemInput = document.getElementById('problem');
+    const showSteps = document.getElementById('show-steps').checked;
+    const resultDiv = document.getElementById('result');
+    const calculateBtn = document.querySelector('.calculate-btn');
+
+    const problem = problemInput.value.trim();
+
+    if (!problem) {
+        alert('Por favor, ingresa un problema matemático');
+        return;
+    }
+
+    if (isCalculating) return;
+
+    isCalculating = true;
+    calculateBtn.disabled = true;
+    calculateBtn.textContent = '🤔 Calculando...';
+
+    // Mostrar loading
+    resultDiv.innerHTML = `
+        <div class="result loading">
+            <div class="spinner"></div>
+            Resolviendo problema matemático...
+        </div>
+    `;
+
+    try {
+        const response = await fetch('/chat', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                message: problem,
+                stream: true
+            })
+        });
+
+        if (!response.ok) {
+            throw new Error('Error en la respuesta del servidor');
+        }
+
+        // Leer respuesta streaming línea a línea (los frames pueden llegar
+        // partidos entre chunks de red)
+        const reader = response.body
+            .pipeThrough(new TextDecoderStream())
+            .pipeThrough(splitLines())
+            .getReader();
+        let fullResponse = '';
+
+        resultDiv.innerHTML = '<div class="result"></div>';
+        const resultContent = resultDiv.querySelector('.result');
+
+        while (true) {
+            const { value: line, done } = await reader.read();
+            if (done) break;
+            if (!line.startsWith('data: ')) continue;
+
+            let data;
+            try {
+                data = JSON.parse(line.slice(6));
+            } catch (e) {
+                continue;  // Ignorar frames mal formados
+            }
+
+            if (data.response) {
+                fullResponse += data.response;
+                resultContent.innerHTML = formatMathResponse(fullResponse);
+            }
+            if (data.done) {
+                await reader.cancel();
+                break;
+            }
+        }
+
+    } catch (error) {
+        resultDiv.innerHTML = `
+            <div class="result" style="border-left-color: #ff6b6b;">
+                <strong>❌ Error:</strong> ${error.message}
+            </div>
+        `;
+    } finally {
+        isCalculating = false;
+        calculateBtn.disabled = false;
+        calculateBtn.textContent = '🔢 Calcular';
+    }
+}
+
+// Markdown básico + emojis del formato de respuesta, en una sola expresión
+const MATH_TOKEN_RE = /\*\*(.*?)\*\*|\*(.*?)\*|`(.*?)`|\n|📊|🔢|📝/gu;
+
+const EMOJI_COLORS = {
+    '📊': '#4ECDC4',
+    '🔢': '#FF6B6B',
+    '📝': '#667eea'
+};
+
+function formatMathResponse(text) {
+    // Convertir markdown básico a HTML en una única pasada sobre el texto
+    return text.replace(MATH_TOKEN_RE, (match, bold, italic, code) => {
+        if (bold !== undefined) return `<strong>${formatMathResponse(bold)}</strong>`;
+        if (italic !== undefined) return `<em>${formatMathResponse(italic)}</em>`;
+        if (code !== undefined) return `<code>${code}</code>`;
+        if (match === '\n') return '<br>';
+        return `<span style="color: ${EMOJI_COLORS[match]};">${match}</span>`;
+    });
+}
+
+// Permitir envío con Enter (Ctrl+Enter para nueva línea)
+document.getElementById('problem').addEventListener('keydown', function(e) {
+    if (e.key === 'Enter' && !e.ctrlKey) {
+        e.preventDefault();
+        calculate();
+    }
+});
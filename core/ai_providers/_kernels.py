@@ -0,0 +1,84 @@
+"""
+AI Forge - Numeric Kernels
+Kernels numéricos para los proveedores (similitud de embeddings)
+
+Si numba y numpy están instalados, los kernels se compilan con
+@njit(cache=True) (la compilación queda cacheada en disco); si no, el mismo
+código se ejecuta en Python puro. Este módulo solo se importa cuando la caché
+semántica está activa, para no pagar el coste de importar numba en el resto
+de casos.
+"""
+
+import heapq
+import math
+from typing import List, Sequence, Tuple
+
+try:
+    import numpy as np
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    np = None
+    HAS_NUMBA = False
+    prange = range
+    
+    def njit(*args, **kwargs):
+        """Sustituto de numba.njit que deja la función sin compilar"""
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+@njit(cache=True, fastmath=True)
+def cosine_sim(a, b) -> float:
+    """
+    Similitud coseno entre dos vectores de la misma dimensión
+    
+    Returns:
+        Similitud en [-1, 1] (0.0 si alguno de los vectores es nulo)
+    """
+    dot = 0.0
+    norm_a = 0.0
+    norm_b = 0.0
+    for i in range(len(a)):
+        dot += a[i] * b[i]
+        norm_a += a[i] * a[i]
+        norm_b += b[i] * b[i]
+    if norm_a == 0.0 or norm_b == 0.0:
+        return 0.0
+    return dot / math.sqrt(norm_a * norm_b)
+
+
+@njit(cache=True, fastmath=True, parallel=True)
+def _similarities(matrix, query, out):
+    """Rellena out[i] con la similitud entre matrix[i] y query"""
+    for i in prange(len(matrix)):
+        out[i] = cosine_sim(matrix[i], query)
+
+
+def topk(query: Sequence[float], vectors: List[Sequence[float]], k: int = 1) -> List[Tuple[int, float]]:
+    """
+    Busca los k vectores más parecidos a query
+    
+    Args:
+        query: Vector de consulta
+        vectors: Vectores candidatos (todos de la misma dimensión que query)
+        k: Número de resultados
+        
+    Returns:
+        Lista de (índice en vectors, similitud), de mayor a menor similitud
+    """
+    if not vectors:
+        return []
+    
+    if HAS_NUMBA:
+        matrix = np.asarray(vectors, dtype=np.float64)
+        query = np.asarray(query, dtype=np.float64)
+        out = np.empty(len(vectors), dtype=np.float64)
+    else:
+        matrix = vectors
+        out = [0.0] * len(vectors)
+    
+    _similarities(matrix, query, out)
+    best = heapq.nlargest(k, range(len(out)), key=out.__getitem__)
+    return [(i, float(out[i])) for i in best]
@@ -4,9 +4,56 @@ Clase base abstracta para todos los proveedores de IA
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, List, Any, Optional, AsyncGenerator
+from collections import OrderedDict
+from contextlib import aclosing
+from types import MappingProxyType
+from typing import Dict, List, Any, Optional, AsyncGenerator, Tuple
 import asyncio
-import json
+import hashlib
+import inspect
+import logging
+import math
+import time
+
+import httpx
+
+from ..json_utils import dumps as _dumps
+from .shared_cache import SharedResponseCache
+
+try:
+    import h2  # noqa: F401  (httpx solo negocia HTTP/2 si está instalado)
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+
+logger = logging.getLogger(__name__)
+
+# Longitud máxima del detalle de error incluido en los mensajes
+_ERROR_DETAIL_MAX = 512
+
+# Framing SSE precalculado
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+_SSE_DONE = b'data: {"response":"","done":true}\n\n'
+
+# TTL de la lista de modelos usada por validate_model (segundos)
+_MODELS_TTL = 30.0
+
+# Tiempo máximo de cada fase de test_connection (segundos)
+_TEST_TIMEOUT = 5.0
+
+# Agrupación de tokens en frames SSE (ver _coalesce_stream)
+_COALESCE_MAX_TOKENS = 50
+_COALESCE_MAX_CHARS = 4096
+_COALESCE_MAX_DELAY = 0.01
+
+# Pool de conexiones compartido por todos los proveedores
+_HTTP_LIMITS = httpx.Limits(
+    max_keepalive_connections=40,
+    max_connections=100,
+    keepalive_expiry=30.0
+)
 
 
 class BaseAIProvider(ABC):
@@ -16,9 +63,35 @@ class BaseAIProvider(ABC):
     Define la interfaz común que deben implementar todos los proveedores
     """
     
+    # Cliente HTTP compartido (se crea al primer uso, ver _client)
+    _shared_client: Optional[httpx.AsyncClient] = None
+    _shared_client_loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    # Caché de respuestas compartida (ver _get_shared_cache)
+    _shared_cache: Optional[SharedResponseCache] = None
+    _shared_cache_loaded = False
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        
+        # chat_stream debe ser un generador asíncrono: StreamingResponse
+        # itera los generadores síncronos en el thread pool, un chunk a la vez
+        chat_stream = cls.__dict__.get("chat_stream")
+        if chat_stream is not None and not inspect.isasyncgenfunction(chat_stream):
+            raise TypeError(
+                f"{cls.__name__}.chat_stream must be an async generator function (async def + yield)"
+            )
+    
     def __init__(self, name: str = None):
         self.name = name or self.__class__.__name__.replace('Provider', '').lower()
         self._config = {}
+        # Vista de solo lectura de _config (get_config sin clave) e info memoizada
+        self._config_view = MappingProxyType(self._config)
+        self._config_info_cache: Optional[Dict[str, Any]] = None
+        # Caché de respuestas: key -> (expira, context_key, respuesta, embedding)
+        self._response_cache: "OrderedDict[bytes, Tuple[float, bytes, str, Optional[List[float]]]]" = OrderedDict()
+        # Modelos conocidos por validate_model: (timestamp monotónico, modelos)
+        self._validated_models: Optional[Tuple[float, List[str]]] = None
     
     @abstractmethod
     def is_available(self) -> bool:
@@ -30,6 +103,18 @@ class BaseAIProvider(ABC):
         """
         pass
     
+    async def is_available_async(self) -> bool:
+        """
+        Versión asíncrona de is_available
+        
+        Por defecto ejecuta is_available en un hilo; los proveedores pueden
+        sobrescribirla con una comprobación nativamente asíncrona.
+        
+        Returns:
+            True si el proveedor está disponible
+        """
+        return await asyncio.to_thread(self.is_available)
+    
     @abstractmethod
     async def get_available_models(self) -> List[str]:
         """
@@ -75,7 +160,7 @@ class BaseAIProvider(ABC):
         temperature: float = 0.7,
         max_tokens: int = None,
         **kwargs
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[bytes, None]:
         """
         Envía un mensaje de chat y retorna un stream de la respuesta
         
@@ -89,6 +174,214 @@ class BaseAIProvider(ABC):
             
         Yields:
             Fragmentos de la respuesta en formato server-sent events
+            
+        Note:
+            Debe implementarse como generador asíncrono (async def + yield).
+            Un generador síncrono obligaría a StreamingResponse a pasar cada
+            fragmento por el thread pool, lo que se valida al definir la clase.
+        """
+        pass
+    
+    async def embed(self, text: str, model: str = None) -> Optional[List[float]]:
+        """
+        Calcula el embedding de un texto
+        
+        Los proveedores que no soportan embeddings no necesitan implementarlo.
+        
+        Args:
+            text: Texto a convertir
+            model: Modelo de embeddings a usar (opcional)
+            
+        Returns:
+            Vector de embedding o None si no está soportado
+        """
+        return None
+    
+    async def chat_cached(
+        self, 
+        message: str, 
+        model: str = None, 
+        system_prompt: str = None,
+        temperature: float = 0.7,
+        max_tokens: int = None,
+        **kwargs
+    ) -> str:
+        """
+        Igual que chat(), pero consultando antes la caché de respuestas
+        
+        Primero busca una coincidencia exacta (LRU con TTL), luego en la caché
+        compartida (Redis, si REDIS_URL está definida). Si no la hay y el
+        proveedor tiene configurado "semantic_cache_model", busca entre los
+        prompts recientes con los mismos parámetros (modelo, system prompt,
+        temperatura, max_tokens y kwargs) el más parecido, y reutiliza su
+        respuesta si la similitud coseno supera "semantic_cache_threshold".
+        
+        Configuración (en _config):
+            cache_ttl: Segundos de vida de cada entrada (por defecto 3600)
+            cache_max_entries: Tamaño máximo de la caché (por defecto 256)
+            semantic_cache_model: Modelo de embeddings (None desactiva el nivel semántico)
+            semantic_cache_threshold: Similitud mínima (por defecto 0.95)
+            shared_cache_ttl: Segundos de vida en Redis (por defecto 86400)
+            
+        Returns:
+            Respuesta completa del modelo (posiblemente cacheada)
+        """
+        model = model or self.get_config("default_model")
+        # Los kwargs (top_p, num_ctx...) cambian la respuesta: forman parte de la clave
+        context_key = self._cache_digest(
+            model, system_prompt, round(temperature, 2), max_tokens, sorted(kwargs.items())
+        )
+        key = self._cache_digest(context_key.hex(), message)
+        
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        
+        shared_cache = self._get_shared_cache()
+        shared_key = self._cache_digest(self.name, key.hex())
+        if shared_cache is not None:
+            cached = await shared_cache.get(shared_key)
+            if cached is not None:
+                self._cache_put(key, context_key, cached, None)
+                return cached
+        
+        embedding = None
+        semantic_model = self.get_config("semantic_cache_model")
+        if semantic_model:
+            try:
+                embedding = self._normalize(await self.embed(message, model=semantic_model))
+            except Exception:
+                embedding = None
+            if embedding is not None:
+                cached = self._cache_get_similar(context_key, embedding)
+                if cached is not None:
+                    return cached
+        
+        response = await self.chat(
+            message=message,
+            model=model,
+            system_prompt=system_prompt,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **kwargs
+        )
+        self._cache_put(key, context_key, response, embedding)
+        if shared_cache is not None:
+            await shared_cache.set(shared_key, response, self.get_config("shared_cache_ttl", 86400))
+        return response
+    
+    @classmethod
+    def _get_shared_cache(cls) -> Optional[SharedResponseCache]:
+        """Caché compartida entre procesos (se configura una vez desde REDIS_URL)"""
+        if not BaseAIProvider._shared_cache_loaded:
+            BaseAIProvider._shared_cache = SharedResponseCache.from_env()
+            BaseAIProvider._shared_cache_loaded = True
+        return BaseAIProvider._shared_cache
+    
+    def clear_response_cache(self):
+        """Vacía la caché de respuestas"""
+        self._response_cache.clear()
+    
+    @staticmethod
+    def _cache_digest(*parts: Any) -> bytes:
+        """Hash compacto (blake2b) de los componentes de una clave de caché"""
+        raw = "\x1f".join("" if part is None else str(part) for part in parts)
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).digest()
+    
+    @staticmethod
+    def _normalize(vector: Optional[List[float]]) -> Optional[List[float]]:
+        """Normaliza un vector para que el producto escalar sea la similitud coseno"""
+        if not vector:
+            return None
+        norm = math.sqrt(sum(x * x for x in vector))
+        if norm == 0:
+            return None
+        return [x / norm for x in vector]
+    
+    def _cache_get(self, key: bytes) -> Optional[str]:
+        """Busca una coincidencia exacta vigente y la marca como reciente"""
+        entry = self._response_cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._response_cache[key]
+            return None
+        self._response_cache.move_to_end(key)
+        return entry[2]
+    
+    def _cache_get_similar(self, context_key: bytes, embedding: List[float]) -> Optional[str]:
+        """Busca la respuesta cacheada semánticamente más cercana"""
+        # Import diferido: solo se carga (con numba, si está) al usar la caché semántica
+        from ._kernels import topk
+        
+        threshold = self.get_config("semantic_cache_threshold", 0.95)
+        now = time.monotonic()
+        keys, vectors = [], []
+        
+        for key, (expires_at, entry_context, _, entry_embedding) in self._response_cache.items():
+            if entry_embedding is None or entry_context != context_key or expires_at < now:
+                continue
+            if len(entry_embedding) != len(embedding):
+                continue
+            keys.append(key)
+            vectors.append(entry_embedding)
+        
+        best = topk(embedding, vectors, k=1)
+        if not best or best[0][1] < threshold:
+            return None
+        
+        best_key = keys[best[0][0]]
+        self._response_cache.move_to_end(best_key)
+        return self._response_cache[best_key][2]
+    
+    def _cache_put(self, key: bytes, context_key: bytes, response: str, embedding: Optional[List[float]]):
+        """Guarda una respuesta respetando TTL y tamaño máximo"""
+        ttl = self.get_config("cache_ttl", 3600)
+        max_entries = self.get_config("cache_max_entries", 256)
+        
+        self._response_cache[key] = (time.monotonic() + ttl, context_key, response, embedding)
+        self._response_cache.move_to_end(key)
+        while len(self._response_cache) > max_entries:
+            self._response_cache.popitem(last=False)
+    
+    @classmethod
+    async def _client(cls) -> httpx.AsyncClient:
+        """
+        Obtiene el cliente HTTP compartido, creándolo si hace falta
+        
+        Reutilizar un único AsyncClient mantiene las conexiones keep-alive
+        (y HTTP/2 cuando h2 está instalado) entre peticiones. Las conexiones
+        pertenecen a un event loop, por lo que el cliente se recrea si cambia.
+        
+        Returns:
+            Cliente httpx compartido por todos los proveedores
+        """
+        loop = asyncio.get_running_loop()
+        client = BaseAIProvider._shared_client
+        
+        if client is None or client.is_closed or BaseAIProvider._shared_client_loop is not loop:
+            client = httpx.AsyncClient(http2=_HTTP2_AVAILABLE, limits=_HTTP_LIMITS)
+            BaseAIProvider._shared_client = client
+            BaseAIProvider._shared_client_loop = loop
+        
+        return client
+    
+    @classmethod
+    async def aclose_client(cls):
+        """Cierra el cliente HTTP y la caché compartidos (llamar al apagar la aplicación)"""
+        client = BaseAIProvider._shared_client
+        BaseAIProvider._shared_client = None
+        BaseAIProvider._shared_client_loop = None
+        if client is not None and not client.is_closed:
+            await client.aclose()
+        if BaseAIProvider._shared_cache is not None:
+            await BaseAIProvider._shared_cache.aclose()
+    
+    async def aclose(self):
+        """
+        Libera los recursos propios del proveedor (conexiones, tareas, etc.)
+        
+        El cliente HTTP compartido se cierra aparte con aclose_client().
         """
         pass
     
@@ -104,6 +397,18 @@ class BaseAIProvider(ABC):
         except Exception:
             return False
     
+    async def health_check_async(self) -> bool:
+        """
+        Versión asíncrona de health_check
+        
+        Returns:
+            True si el proveedor está funcionando correctamente
+        """
+        try:
+            return await self.is_available_async()
+        except Exception:
+            return False
+    
     def get_provider_name(self) -> str:
         """
         Obtiene el nombre del proveedor
@@ -126,14 +431,19 @@ class BaseAIProvider(ABC):
         """
         Obtiene información de configuración del proveedor
         
+        El resultado se memoiza hasta la siguiente llamada a set_config; es
+        compartido, así que no debe modificarse.
+        
         Returns:
             Diccionario con información de configuración
         """
-        return {
-            "name": self.name,
-            "type": self.get_provider_type(),
-            "config_keys": list(self._config.keys()) if hasattr(self, '_config') else []
-        }
+        if self._config_info_cache is None:
+            self._config_info_cache = {
+                "name": self.name,
+                "type": self.get_provider_type(),
+                "config_keys": list(self._config.keys())
+            }
+        return self._config_info_cache
     
     def set_config(self, config: Dict[str, Any]):
         """
@@ -143,6 +453,7 @@ class BaseAIProvider(ABC):
             config: Diccionario de configuración
         """
         self._config.update(config)
+        self._config_info_cache = None
     
     def get_config(self, key: str = None, default: Any = None) -> Any:
         """
@@ -153,10 +464,10 @@ class BaseAIProvider(ABC):
             default: Valor por defecto si la clave no existe
             
         Returns:
-            Valor de configuración
+            Valor de configuración (con key=None, una vista de solo lectura)
         """
         if key is None:
-            return self._config.copy()
+            return self._config_view
         return self._config.get(key, default)
     
     async def validate_model(self, model: str) -> bool:
@@ -170,27 +481,117 @@ class BaseAIProvider(ABC):
             True si el modelo está disponible
         """
         try:
-            available_models = await self.get_available_models()
+            cached = self._validated_models
+            if cached is not None and time.monotonic() - cached[0] < _MODELS_TTL:
+                available_models = cached[1]
+            else:
+                available_models = await self.get_available_models()
+                self._validated_models = (time.monotonic(), available_models)
             return model in available_models
         except Exception:
             return False
     
-    def _format_stream_response(self, content: str, done: bool = False) -> str:
+    def _format_stream_response(self, content: str, done: bool = False) -> bytes:
         """
         Formatea una respuesta para streaming compatible con Server-Sent Events
         
+        Retorna bytes para que StreamingResponse los envíe sin re-codificar.
+        
         Args:
             content: Contenido de la respuesta
             done: Si la respuesta está completa
             
         Returns:
-            String formateado para SSE
+            Frame SSE ya codificado
         """
-        data = {
-            "response": content,
-            "done": done
-        }
-        return f"data: {json.dumps(data)}\n\n"
+        if done and not content:
+            return _SSE_DONE
+        return _SSE_PREFIX + _dumps({"response": content, "done": done}) + _SSE_SUFFIX
+    
+    async def _coalesce_stream(
+        self,
+        tokens: AsyncGenerator[str, None],
+        context: str = "chat_stream",
+        max_tokens_per_frame: int = _COALESCE_MAX_TOKENS,
+        max_delay: float = _COALESCE_MAX_DELAY,
+        max_chars_per_frame: int = _COALESCE_MAX_CHARS
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        Agrupa los tokens de un stream en frames SSE
+        
+        Un frame se envía al acumular max_tokens_per_frame tokens o
+        max_chars_per_frame caracteres (~4 KB), o cuando el primer token
+        pendiente lleva max_delay segundos esperando, lo que ocurra antes.
+        Así se amortiza la serialización y el envío por socket entre varios
+        tokens sin retrasar la respuesta más de max_delay.
+        Siempre termina con un frame done=True; si el stream falla, se envía
+        lo acumulado y después el error.
+        
+        Args:
+            tokens: Generador asíncrono de fragmentos de texto (se cierra al
+                terminar)
+            context: Contexto para los mensajes de error
+            max_tokens_per_frame: Máximo de tokens por frame
+            max_delay: Espera máxima (segundos) antes de enviar un frame
+            max_chars_per_frame: Máximo de caracteres acumulados por frame
+            
+        Yields:
+            Frames SSE ya codificados
+        """
+        # aclosing cierra tokens al salir (después de cancelar la lectura
+        # pendiente), aunque este generador se cierre a mitad del stream
+        async with aclosing(tokens):
+            buffer: List[str] = []
+            pending: Optional[asyncio.Future] = None
+            deadline: Optional[float] = None
+            buffered_chars = 0
+            
+            try:
+                while True:
+                    # La lectura del siguiente token es una tarea propia para
+                    # poder vencer el plazo sin cancelar el stream de origen
+                    if pending is None:
+                        pending = asyncio.ensure_future(tokens.__anext__())
+                    
+                    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                    done, _ = await asyncio.wait((pending,), timeout=timeout)
+                    
+                    if not done:
+                        yield self._format_stream_response("".join(buffer))
+                        buffer.clear()
+                        buffered_chars = 0
+                        deadline = None
+                        continue
+                    
+                    task, pending = pending, None
+                    try:
+                        token = task.result()
+                    except StopAsyncIteration:
+                        break
+                    buffer.append(token)
+                    buffered_chars += len(token)
+                    
+                    if deadline is None:
+                        deadline = time.monotonic() + max_delay
+                    if len(buffer) >= max_tokens_per_frame or buffered_chars >= max_chars_per_frame:
+                        yield self._format_stream_response("".join(buffer))
+                        buffer.clear()
+                        buffered_chars = 0
+                        deadline = None
+                
+                if buffer:
+                    yield self._format_stream_response("".join(buffer))
+                yield self._format_stream_response("", done=True)
+                
+            except Exception as e:
+                if buffer:
+                    yield self._format_stream_response("".join(buffer))
+                yield self._format_stream_response(self._handle_error(e, context), done=True)
+                
+            finally:
+                if pending is not None:
+                    pending.cancel()
+                    await asyncio.wait((pending,))
     
     def _handle_error(self, error: Exception, context: str = "") -> str:
         """
@@ -200,14 +601,21 @@ class BaseAIProvider(ABC):
             error: Excepción ocurrida
             context: Contexto donde ocurrió el error
             
+        El detalle del error se trunca a _ERROR_DETAIL_MAX caracteres (puede
+        contener el cuerpo completo de una respuesta HTTP); la traza completa
+        queda en el log.
+        
         Returns:
             Mensaje de error formateado
         """
-        error_msg = f"Error in {self.name}"
+        parts = ["Error in ", self.name]
         if context:
-            error_msg += f" ({context})"
-        error_msg += f": {str(error)}"
+            parts.append(f" ({context})")
+        parts.append(": ")
+        parts.append(str(error)[:_ERROR_DETAIL_MAX])
+        error_msg = "".join(parts)
         
+        logger.error(error_msg, exc_info=error)
         return error_msg
     
     async def test_connection(self) -> Dict[str, Any]:
@@ -226,30 +634,32 @@ class BaseAIProvider(ABC):
             "response_time": None
         }
         
+        start_time = time.monotonic()
+        
         try:
-            import time
-            start_time = time.time()
-            
-            # Verificar disponibilidad
-            result["available"] = self.is_available()
+            # Verificar disponibilidad sin bloquear el event loop
+            result["available"] = await asyncio.wait_for(
+                self.is_available_async(),
+                timeout=_TEST_TIMEOUT
+            )
             
             if result["available"]:
-                # Contar modelos
-                models = await self.get_available_models()
+                # Contar modelos y enviar un mensaje mínimo en paralelo
+                models, test_response = await asyncio.wait_for(
+                    asyncio.gather(
+                        self.get_available_models(),
+                        self.chat(message="ping", max_tokens=1)
+                    ),
+                    timeout=_TEST_TIMEOUT
+                )
                 result["models_count"] = len(models)
-                
-                # Test de mensaje simple (si hay modelos disponibles)
-                if models:
-                    test_response = await self.chat(
-                        message="Hello", 
-                        model=models[0],
-                        max_tokens=10
-                    )
-                    result["test_message"] = test_response[:50] + "..." if len(test_response) > 50 else test_response
-            
-            result["response_time"] = round((time.time() - start_time) * 1000, 2)  # ms
+                result["test_message"] = test_response[:50] + "..." if len(test_response) > 50 else test_response
             
+        except asyncio.TimeoutError:
+            result["error"] = f"Timed out after {_TEST_TIMEOUT}s"
         except Exception as e:
             result["error"] = str(e)
         
+        result["response_time"] = round((time.monotonic() - start_time) * 1000, 2)  # ms
+        
         return result
\ No newline at end of file
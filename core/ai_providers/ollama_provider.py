@@ -4,12 +4,39 @@ Proveedor para conectar con Ollama (IA local)
 """
 
 import os
-import json
+import asyncio
+import logging
 import time
+from contextlib import aclosing
 import httpx
-from typing import List, Dict, Any, AsyncGenerator
+from typing import List, Dict, Any, AsyncGenerator, Optional, Union
+from ..json_utils import dumps as json_dumps, loads as json_loads, JSONDecodeError
 from .base_provider import BaseAIProvider
 
+logger = logging.getLogger(__name__)
+
+# Opciones de generación que se reenvían a Ollama desde kwargs
+_ALLOWED_OPTIONS = frozenset({"top_p", "top_k", "repeat_penalty", "num_ctx"})
+
+# Generaciones simultáneas por defecto (OLLAMA_MAX_CONCURRENCY)
+_DEFAULT_MAX_CONCURRENCY = 4
+
+
+def _max_concurrency_from_env() -> int:
+    """Lee OLLAMA_MAX_CONCURRENCY (mínimo 1; si no es un entero, el valor por defecto)"""
+    raw = os.getenv("OLLAMA_MAX_CONCURRENCY")
+    if raw is None:
+        return _DEFAULT_MAX_CONCURRENCY
+    try:
+        value = int(raw)
+    except ValueError:
+        logger.warning("Invalid OLLAMA_MAX_CONCURRENCY %r, using %d", raw, _DEFAULT_MAX_CONCURRENCY)
+        return _DEFAULT_MAX_CONCURRENCY
+    if value < 1:
+        logger.warning("OLLAMA_MAX_CONCURRENCY must be at least 1, got %d; using 1", value)
+        return 1
+    return value
+
 
 class OllamaProvider(BaseAIProvider):
     """
@@ -22,30 +49,124 @@ class OllamaProvider(BaseAIProvider):
     - Configuración flexible
     """
     
+    # Cabeceras de las peticiones con cuerpo JSON (se construyen una vez)
+    _JSON_HEADERS = {"Content-Type": "application/json", "Accept": "application/x-ndjson"}
+    
+    # Vigencia (segundos) del resultado de is_available
+    _AVAILABLE_TTL = 120.0
+    _UNAVAILABLE_TTL = 10.0
+    
     def __init__(self):
         super().__init__("ollama")
         self.base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
         self._models_cache = None
         self._cache_timeout = 300  # 5 minutos
         self._last_cache_time = 0
+        self._models_refresh_task: Optional[asyncio.Task] = None
         
-        # Configuración por defecto
-        self._config = {
+        # Parte estática de get_config_info; se marca sucia al cambiar el
+        # cache de modelos (set_config invalida además la de la clase base)
+        self._ollama_config_info: Dict[str, Any] = {}
+        self._config_info_dirty = True
+        
+        # Cache de is_available: (resultado, timestamp monotónico)
+        self._avail_cache: Optional[bool] = None
+        self._avail_ts = 0.0
+        
+        # Límite de generaciones simultáneas contra el servidor Ollama: el
+        # resto de peticiones espera turno en lugar de saturar el proceso
+        self._max_concurrency = _max_concurrency_from_env()
+        self._gen_sem = asyncio.Semaphore(self._max_concurrency)
+        
+        # Timeout de pull_model: conexión, escritura y pool cortos; la lectura
+        # del stream de progreso no tiene límite (una descarga larga es normal)
+        connect_timeout = float(os.getenv("OLLAMA_PULL_CONNECT_TIMEOUT", "5.0"))
+        self._pull_timeout = httpx.Timeout(
+            connect=connect_timeout, read=None, write=connect_timeout, pool=connect_timeout
+        )
+        
+        # Configuración por defecto (se actualiza el dict de la clase base,
+        # que ya tiene una vista de solo lectura asociada)
+        self._config.update({
             "base_url": self.base_url,
             "timeout": 60.0,
             "default_model": "llama3.2",
-            "stream": True
-        }
+            "stream": True,
+            "cache_ttl": 3600,
+            "cache_max_entries": 256,
+            "semantic_cache_model": os.getenv("OLLAMA_EMBED_MODEL"),  # ej. mxbai-embed-large
+            "semantic_cache_threshold": 0.95,
+            "shared_cache_ttl": 86400
+        })
+    
+    def _post_json(self, client: httpx.AsyncClient, path: str, payload: Dict[str, Any], timeout: float):
+        """POST con el cuerpo ya serializado a bytes (orjson si está disponible)"""
+        return client.post(
+            f"{self.base_url}{path}",
+            content=json_dumps(payload),
+            headers=self._JSON_HEADERS,
+            timeout=timeout
+        )
+    
+    def _stream_json(self, client: httpx.AsyncClient, path: str, payload: Dict[str, Any], timeout: Union[float, httpx.Timeout]):
+        """Igual que _post_json, pero como context manager de streaming"""
+        return client.stream(
+            "POST",
+            f"{self.base_url}{path}",
+            content=json_dumps(payload),
+            headers=self._JSON_HEADERS,
+            timeout=timeout
+        )
     
     def is_available(self) -> bool:
-        """Verifica si Ollama está disponible"""
+        """Verifica si Ollama está disponible (resultado cacheado, ver _cached_availability)"""
+        cached = self._cached_availability()
+        if cached is not None:
+            return cached
+        
         try:
-            import httpx
             with httpx.Client(timeout=5.0) as client:
                 response = client.get(f"{self.base_url}/api/tags")
-                return response.status_code == 200
+                available = response.status_code == 200
         except Exception:
-            return False
+            available = False
+        
+        return self._store_availability(available)
+    
+    async def is_available_async(self) -> bool:
+        """Igual que is_available, sin bloquear el event loop (usa el cliente compartido)"""
+        cached = self._cached_availability()
+        if cached is not None:
+            return cached
+        
+        try:
+            client = await self._client()
+            response = await client.get(f"{self.base_url}/api/tags", timeout=5.0)
+            available = response.status_code == 200
+        except Exception:
+            available = False
+        
+        return self._store_availability(available)
+    
+    def _cached_availability(self) -> Optional[bool]:
+        """
+        Último resultado de disponibilidad si sigue vigente
+        
+        Los positivos duran _AVAILABLE_TTL y los negativos _UNAVAILABLE_TTL
+        (más corto, para detectar pronto que Ollama ha arrancado).
+        """
+        if self._avail_cache is None:
+            return None
+        ttl = self._AVAILABLE_TTL if self._avail_cache else self._UNAVAILABLE_TTL
+        if time.monotonic() - self._avail_ts >= ttl:
+            return None
+        return self._avail_cache
+    
+    def _store_availability(self, available: bool) -> bool:
+        """Guarda el resultado de una comprobación de disponibilidad"""
+        self._avail_cache = available
+        self._avail_ts = time.monotonic()
+        return available
     
     def get_provider_type(self) -> str:
         """Retorna el tipo de proveedor"""
@@ -53,33 +174,77 @@ class OllamaProvider(BaseAIProvider):
     
     async def get_available_models(self) -> List[str]:
         """Obtiene modelos disponibles en Ollama"""
-        import time
-        
-        # Usar cache si es válido
-        current_time = time.time()
+        # Usar cache si es válido (monotónico: solo se usa para medir antigüedad)
         if (self._models_cache is not None and 
-            current_time - self._last_cache_time < self._cache_timeout):
+            time.monotonic() - self._last_cache_time < self._cache_timeout):
             return self._models_cache
         
+        # Single-flight: las llamadas concurrentes esperan al mismo refresco
+        task = self._models_refresh_task
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            task = self._models_refresh_task = asyncio.create_task(self._refresh_models())
+        return await asyncio.shield(task)
+    
+    async def _refresh_models(self) -> List[str]:
+        """Consulta /api/tags y actualiza el cache de modelos"""
         try:
-            async with httpx.AsyncClient(timeout=self._config["timeout"]) as client:
-                response = await client.get(f"{self.base_url}/api/tags")
+            client = await self._client()
+            response = await client.get(
+                f"{self.base_url}/api/tags",
+                timeout=self._config["timeout"]
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                models = [model["name"] for model in data.get("models", [])]
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    models = [model["name"] for model in data.get("models", [])]
-                    
-                    # Actualizar cache
-                    self._models_cache = models
-                    self._last_cache_time = current_time
-                    
-                    return models
-                else:
-                    return []
-        except Exception as e:
-            print(f"Error getting Ollama models: {e}")
+                # Actualizar cache
+                self._models_cache = models
+                self._last_cache_time = time.monotonic()
+                self._config_info_dirty = True
+                
+                return models
+            else:
+                return []
+        except Exception:
+            logger.exception("Error getting Ollama models")
             return []
     
+    def _generate_payload(
+        self,
+        message: str,
+        model: Optional[str],
+        system_prompt: Optional[str],
+        temperature: float,
+        max_tokens: Optional[int],
+        stream: bool,
+        kwargs: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Construye el cuerpo de /api/generate (literales de dict, sin updates)"""
+        options = {"temperature": temperature}
+        
+        # Agregar parámetros adicionales
+        if max_tokens:
+            options["num_predict"] = max_tokens
+        
+        # Agregar opciones de kwargs
+        for key, value in kwargs.items():
+            if key in _ALLOWED_OPTIONS:
+                options[key] = value
+        
+        payload = {
+            "model": model or self._config["default_model"],
+            "prompt": message,
+            "stream": stream,
+            "options": options
+        }
+        
+        # Agregar system prompt si se proporciona
+        if system_prompt:
+            payload["system"] = system_prompt
+        
+        return payload
+    
     async def chat(
         self, 
         message: str, 
@@ -90,44 +255,23 @@ class OllamaProvider(BaseAIProvider):
         **kwargs
     ) -> str:
         """Chat sin streaming - retorna respuesta completa"""
-        model = model or self._config["default_model"]
-        
-        payload = {
-            "model": model,
-            "prompt": message,
-            "stream": False,
-            "options": {
-                "temperature": temperature,
-            }
-        }
-        
-        # Agregar system prompt si se proporciona
-        if system_prompt:
-            payload["system"] = system_prompt
-        
-        # Agregar parámetros adicionales
-        if max_tokens:
-            payload["options"]["num_predict"] = max_tokens
-        
-        # Agregar opciones de kwargs
-        payload["options"].update({
-            k: v for k, v in kwargs.items() 
-            if k in ["top_p", "top_k", "repeat_penalty", "num_ctx"]
-        })
+        payload = self._generate_payload(
+            message, model, system_prompt, temperature, max_tokens, False, kwargs
+        )
         
         try:
-            async with httpx.AsyncClient(timeout=self._config["timeout"]) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/generate",
-                    json=payload
+            client = await self._client()
+            async with self._gen_sem:
+                response = await self._post_json(
+                    client, "/api/generate", payload, self._config["timeout"]
                 )
+            
+            if response.status_code == 200:
+                data = response.json()
+                return data.get("response", "")
+            else:
+                raise Exception(f"Ollama API error: {response.status_code}")
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    return data.get("response", "")
-                else:
-                    raise Exception(f"Ollama API error: {response.status_code}")
-                    
         except Exception as e:
             raise Exception(self._handle_error(e, "chat"))
     
@@ -139,83 +283,118 @@ class OllamaProvider(BaseAIProvider):
         temperature: float = 0.7,
         max_tokens: int = None,
         **kwargs
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[bytes, None]:
         """Chat con streaming - yields fragmentos de respuesta"""
-        model = model or self._config["default_model"]
+        payload = self._generate_payload(
+            message, model, system_prompt, temperature, max_tokens, True, kwargs
+        )
         
-        payload = {
-            "model": model,
-            "prompt": message,
-            "stream": True,
-            "options": {
-                "temperature": temperature,
-            }
-        }
+        # aclosing cierra la cadena de generadores en cuanto se cierra este
+        # stream (cliente desconectado): el turno de _gen_sem y la conexión
+        # se liberan ya, no cuando el GC finalice los generadores
+        async with aclosing(self._coalesce_stream(self._generate_tokens(payload), "chat_stream")) as frames:
+            async for frame in frames:
+                yield frame
+    
+    async def _generate_tokens(self, payload: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        """Lee el stream NDJSON de /api/generate y produce los tokens en texto"""
+        client = await self._client()
+        # El turno se mantiene durante toda la generación y se libera al
+        # terminar, al fallar o si el cliente cierra el stream
+        async with self._gen_sem:
+            async with self._stream_json(
+                client, "/api/generate", payload, self._config["timeout"]
+            ) as response:
+                
+                if response.status_code != 200:
+                    raise Exception(f"Ollama API returned {response.status_code}")
+                
+                async with aclosing(self._iter_ndjson(response)) as messages:
+                    async for data in messages:
+                        if data.get("response"):
+                            yield data["response"]
+                        
+                        if data.get("done", False):
+                            break
+    
+    @staticmethod
+    async def _iter_ndjson(response: httpx.Response) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Parsea un cuerpo NDJSON directamente desde los bytes recibidos
         
-        # Agregar system prompt si se proporciona
-        if system_prompt:
-            payload["system"] = system_prompt
+        Las líneas se parsean con orjson (o json si no está instalado); las
+        inválidas se ignoran.
+        """
+        async with aclosing(OllamaProvider._iter_ndjson_lines(response)) as lines:
+            async for line in lines:
+                try:
+                    yield json_loads(line)
+                except JSONDecodeError:
+                    continue
+    
+    @staticmethod
+    async def _iter_ndjson_lines(response: httpx.Response) -> AsyncGenerator[bytearray, None]:
+        """
+        Parte un cuerpo NDJSON en líneas sin decodificar a str
         
-        # Agregar parámetros adicionales
-        if max_tokens:
-            payload["options"]["num_predict"] = max_tokens
+        Reutiliza un bytearray y busca los saltos de línea con find; produce
+        cada línea no vacía tal cual llegó.
+        """
+        buffer = bytearray()
+        async for chunk in response.aiter_bytes():
+            buffer.extend(chunk)
+            start = 0
+            while True:
+                newline = buffer.find(b"\n", start)
+                if newline < 0:
+                    break
+                line = buffer[start:newline]
+                start = newline + 1
+                if line.strip():
+                    yield line
+            del buffer[:start]
         
-        # Agregar opciones de kwargs
-        payload["options"].update({
-            k: v for k, v in kwargs.items() 
-            if k in ["top_p", "top_k", "repeat_penalty", "num_ctx"]
-        })
+        if buffer.strip():
+            yield buffer
+    
+    async def embed(self, text: str, model: str = None) -> List[float]:
+        """Calcula el embedding de un texto con /api/embeddings"""
+        model = model or self._config.get("semantic_cache_model")
         
         try:
-            async with httpx.AsyncClient(timeout=self._config["timeout"]) as client:
-                async with client.stream(
-                    "POST",
-                    f"{self.base_url}/api/generate",
-                    json=payload
-                ) as response:
-                    
-                    if response.status_code != 200:
-                        yield self._format_stream_response(
-                            f"Error: Ollama API returned {response.status_code}",
-                            done=True
-                        )
-                        return
-                    
-                    async for chunk in response.aiter_lines():
-                        if chunk:
-                            try:
-                                data = json.loads(chunk)
-                                
-                                if "response" in data:
-                                    # Enviar fragmento de respuesta
-                                    yield self._format_stream_response(
-                                        data["response"], 
-                                        done=False
-                                    )
-                                
-                                if data.get("done", False):
-                                    # Señalar fin de respuesta
-                                    yield self._format_stream_response("", done=True)
-                                    break
-                                    
-                            except json.JSONDecodeError:
-                                continue
-                                
+            client = await self._client()
+            response = await self._post_json(
+                client, "/api/embeddings", {"model": model, "prompt": text}, self._config["timeout"]
+            )
+            
+            if response.status_code == 200:
+                return response.json().get("embedding", [])
+            else:
+                raise Exception(f"Ollama API error: {response.status_code}")
+                
         except Exception as e:
-            error_msg = self._handle_error(e, "chat_stream")
-            yield self._format_stream_response(error_msg, done=True)
+            raise Exception(self._handle_error(e, "embed"))
     
     def get_config_info(self) -> Dict[str, Any]:
-        """Información de configuración específica de Ollama"""
-        base_info = super().get_config_info()
-        base_info.update({
-            "base_url": self.base_url,
-            "models_cached": self._models_cache is not None,
-            "cache_age": time.time() - self._last_cache_time if self._last_cache_time > 0 else None
-        })
-        return base_info
+        """
+        Información de configuración específica de Ollama
+        
+        La parte estática se reconstruye solo cuando cambia el cache de
+        modelos o la configuración; cache_age se calcula en cada lectura.
+        """
+        if self._config_info_dirty or self._config_info_cache is None:
+            self._ollama_config_info = {
+                **super().get_config_info(),
+                "base_url": self.base_url,
+                "models_cached": self._models_cache is not None,
+                "max_concurrency": self._max_concurrency
+            }
+            self._config_info_dirty = False
+        
+        cache_age = time.monotonic() - self._last_cache_time if self._last_cache_time > 0 else None
+        return {**self._ollama_config_info, "cache_age": cache_age}
     
-    async def pull_model(self, model_name: str) -> AsyncGenerator[str, None]:
+    async def pull_model(self, model_name: str) -> AsyncGenerator[bytes, None]:
         """
         Descarga un modelo en Ollama
         
@@ -228,39 +407,32 @@ class OllamaProvider(BaseAIProvider):
         payload = {"name": model_name}
         
         try:
-            async with httpx.AsyncClient(timeout=300.0) as client:  # Timeout más largo para downloads
-                async with client.stream(
-                    "POST",
-                    f"{self.base_url}/api/pull",
-                    json=payload
-                ) as response:
-                    
-                    async for chunk in response.aiter_lines():
-                        if chunk:
-                            try:
-                                data = json.loads(chunk)
-                                
-                                # Formatear progreso de descarga
-                                if "status" in data:
-                                    progress_info = {
-                                        "status": data["status"],
-                                        "progress": data.get("progress", 0),
-                                        "total": data.get("total", 0),
-                                        "completed": data.get("completed", 0)
-                                    }
-                                    
-                                    yield self._format_stream_response(
-                                        json.dumps(progress_info),
-                                        done=data.get("status") == "success"
-                                    )
-                                    
-                            except json.JSONDecodeError:
-                                continue
-                                
+            client = await self._client()
+            async with self._stream_json(
+                client, "/api/pull", payload, self._pull_timeout
+            ) as response:
+                
+                async with aclosing(self._iter_ndjson_lines(response)) as lines:
+                    async for line in lines:
+                        # Reenviar la línea de progreso tal cual; solo se parsea
+                        # cuando puede ser el terminador de la descarga
+                        if b'"status"' not in line:
+                            continue
+                        done = b'"success"' in line and self._pull_succeeded(line)
+                        yield self._format_stream_response(line.decode("utf-8", "replace"), done=done)
+                        
         except Exception as e:
             error_msg = self._handle_error(e, "pull_model")
             yield self._format_stream_response(error_msg, done=True)
     
+    @staticmethod
+    def _pull_succeeded(line: bytes) -> bool:
+        """Indica si una línea de progreso de /api/pull es la de éxito final"""
+        try:
+            return json_loads(line).get("status") == "success"
+        except (JSONDecodeError, AttributeError):
+            return False
+    
     async def delete_model(self, model_name: str) -> bool:
         """
         Elimina un modelo de Ollama
@@ -272,19 +444,23 @@ class OllamaProvider(BaseAIProvider):
             True si se eliminó correctamente
         """
         try:
-            async with httpx.AsyncClient(timeout=self._config["timeout"]) as client:
-                response = await client.delete(
-                    f"{self.base_url}/api/delete",
-                    json={"name": model_name}
-                )
+            client = await self._client()
+            response = await client.request(
+                "DELETE",
+                f"{self.base_url}/api/delete",
+                content=json_dumps({"name": model_name}),
+                headers=self._JSON_HEADERS,
+                timeout=self._config["timeout"]
+            )
+            
+            if response.status_code == 200:
+                # Limpiar cache de modelos
+                self._models_cache = None
+                self._config_info_dirty = True
+                return True
+            else:
+                return False
                 
-                if response.status_code == 200:
-                    # Limpiar cache de modelos
-                    self._models_cache = None
-                    return True
-                else:
-                    return False
-                    
         except Exception:
             return False
     
@@ -299,17 +475,16 @@ class OllamaProvider(BaseAIProvider):
             Información del modelo
         """
         try:
-            async with httpx.AsyncClient(timeout=self._config["timeout"]) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/show",
-                    json={"name": model_name}
-                )
+            client = await self._client()
+            response = await self._post_json(
+                client, "/api/show", {"name": model_name}, self._config["timeout"]
+            )
+            
+            if response.status_code == 200:
+                return response.json()
+            else:
+                return {}
                 
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    return {}
-                    
         except Exception:
             return {}
     
@@ -317,5 +492,6 @@ class OllamaProvider(BaseAIProvider):
         """Limpia el cache de modelos"""
         self._models_cache = None
         self._last_cache_time = 0
+        self._config_info_dirty = True
     
     
\ No newline at end of file
@@ -4,10 +4,15 @@ Factory para crear y gestionar diferentes proveedores de IA
 """
 
 import os
+import time
+import asyncio
+import logging
 from typing import Dict, List, Optional, Any
 from .base_provider import BaseAIProvider
 from .ollama_provider import OllamaProvider
 
+logger = logging.getLogger(__name__)
+
 
 class ProviderFactory:
     """
@@ -19,8 +24,25 @@ class ProviderFactory:
     - Anthropic (cloud)
     - Google AI (cloud)
     - Fallback automático
+    
+    Cada proveedor limita sus generaciones simultáneas (en Ollama,
+    OLLAMA_MAX_CONCURRENCY, por defecto 4); las peticiones que exceden el
+    límite esperan turno.
     """
     
+    # Mapeo de tareas a proveedores preferidos
+    TASK_PREFERENCES = {
+        "math": ("ollama", "openai", "google"),
+        "coding": ("anthropic", "ollama", "openai"),
+        "creative": ("anthropic", "openai", "ollama"),
+        "translation": ("google", "openai", "ollama"),
+        "analysis": ("anthropic", "openai", "ollama"),
+        "general": ("ollama", "openai", "anthropic")
+    }
+    
+    # Consultas simultáneas máximas en get_provider_info
+    _INFO_CONCURRENCY = 8
+    
     def __init__(self):
         self._providers = {}
         self._available_providers = {
@@ -39,11 +61,11 @@ class ProviderFactory:
                 provider = provider_class()
                 if provider.is_available():
                     self._providers[name] = provider
-                    print(f"✅ Provider '{name}' initialized successfully")
+                    logger.info("Provider '%s' initialized successfully", name)
                 else:
-                    print(f"⚠️ Provider '{name}' not available (check configuration)")
+                    logger.warning("Provider '%s' not available (check configuration)", name)
             except Exception as e:
-                print(f"❌ Failed to initialize provider '{name}': {e}")
+                logger.error("Failed to initialize provider '%s': %s", name, e)
     
     def get_provider(self, name: str) -> BaseAIProvider:
         """
@@ -83,17 +105,7 @@ class ProviderFactory:
         Returns:
             Mejor proveedor disponible para la tarea
         """
-        # Mapeo de tareas a proveedores preferidos
-        task_preferences = {
-            "math": ["ollama", "openai", "google"],
-            "coding": ["anthropic", "ollama", "openai"], 
-            "creative": ["anthropic", "openai", "ollama"],
-            "translation": ["google", "openai", "ollama"],
-            "analysis": ["anthropic", "openai", "ollama"],
-            "general": ["ollama", "openai", "anthropic"]
-        }
-        
-        preferred_providers = task_preferences.get(task_type, task_preferences["general"])
+        preferred_providers = self.TASK_PREFERENCES.get(task_type, self.TASK_PREFERENCES["general"])
         
         for provider_name in preferred_providers:
             if provider_name in self._providers:
@@ -105,43 +117,67 @@ class ProviderFactory:
         
         return None
     
-    def test_providers(self) -> Dict[str, Dict[str, Any]]:
+    async def test_providers(self) -> Dict[str, Dict[str, Any]]:
         """
-        Prueba todos los proveedores disponibles
+        Prueba todos los proveedores disponibles en paralelo
         
         Returns:
             Diccionario con resultados de las pruebas
         """
-        results = {}
+        names = list(self._providers)
+        results = await asyncio.gather(
+            *(self._test_one(name, self._providers[name]) for name in names),
+            return_exceptions=True
+        )
         
-        for name, provider in self._providers.items():
-            try:
-                # Test básico
-                start_time = __import__('time').time()
-                is_healthy = provider.health_check()
-                response_time = __import__('time').time() - start_time
-                
-                results[name] = {
-                    "status": "healthy" if is_healthy else "unhealthy",
-                    "response_time": round(response_time * 1000, 2),  # ms
-                    "models_available": len(provider.get_available_models()) if is_healthy else 0,
-                    "error": None
-                }
-                
-            except Exception as e:
-                results[name] = {
-                    "status": "error",
-                    "response_time": None,
-                    "models_available": 0,
-                    "error": str(e)
-                }
+        return {
+            name: (
+                {"status": "error", "response_time": None, "models_available": 0, "error": str(result)}
+                if isinstance(result, BaseException) else result
+            )
+            for name, result in zip(names, results)
+        }
+    
+    async def _test_one(self, name: str, provider: BaseAIProvider) -> Dict[str, Any]:
+        """
+        Prueba un proveedor: health check y listado de modelos
         
-        return results
+        Args:
+            name: Nombre del proveedor
+            provider: Instancia del proveedor
+            
+        Returns:
+            Resultado de la prueba
+        """
+        try:
+            start_time = time.perf_counter()
+            is_healthy = await provider.health_check_async()
+            response_time = time.perf_counter() - start_time
+            
+            models = await provider.get_available_models() if is_healthy else []
+            
+            return {
+                "status": "healthy" if is_healthy else "unhealthy",
+                "response_time": round(response_time * 1000, 2),  # ms
+                "models_available": len(models),
+                "error": None
+            }
+            
+        except Exception as e:
+            return {
+                "status": "error",
+                "response_time": None,
+                "models_available": 0,
+                "error": str(e)
+            }
     
-    def get_provider_info(self, provider_name: str = None) -> Dict[str, Any]:
+    async def get_provider_info(self, provider_name: str = None) -> Dict[str, Any]:
         """
         Obtiene información detallada de uno o todos los proveedores
         
+        Con varios proveedores las consultas se hacen en paralelo (como
+        máximo _INFO_CONCURRENCY a la vez).
+        
         Args:
             provider_name: Nombre específico del proveedor (opcional)
             
@@ -153,24 +189,35 @@ class ProviderFactory:
                 raise ValueError(f"Provider '{provider_name}' not available")
             
             provider = self._providers[provider_name]
+            available, models = await asyncio.gather(
+                provider.is_available_async(), provider.get_available_models()
+            )
             return {
                 "name": provider_name,
                 "type": provider.get_provider_type(),
-                "available": provider.is_available(),
-                "models": provider.get_available_models(),
+                "available": available,
+                "models": models,
                 "config": provider.get_config_info()
             }
         else:
             # Información de todos los proveedores
-            info = {}
-            for name, provider in self._providers.items():
-                info[name] = {
+            semaphore = asyncio.Semaphore(self._INFO_CONCURRENCY)
+            
+            async def provider_info(provider: BaseAIProvider) -> Dict[str, Any]:
+                async with semaphore:
+                    available, models = await asyncio.gather(
+                        provider.is_available_async(), provider.get_available_models()
+                    )
+                return {
                     "type": provider.get_provider_type(),
-                    "available": provider.is_available(),
-                    "models_count": len(provider.get_available_models()),
+                    "available": available,
+                    "models_count": len(models),
                     "config": provider.get_config_info()
                 }
-            return info
+            
+            names = list(self._providers)
+            results = await asyncio.gather(*(provider_info(self._providers[name]) for name in names))
+            return dict(zip(names, results))
     
     def auto_configure(self) -> Dict[str, str]:
         """
@@ -205,6 +252,12 @@ class ProviderFactory:
         
         return config
     
+    async def aclose(self):
+        """Cierra los recursos de todos los proveedores y el cliente HTTP compartido"""
+        for provider in self._providers.values():
+            await provider.aclose()
+        await BaseAIProvider.aclose_client()
+    
     def reload_providers(self):
         """Recarga todos los proveedores"""
         self._providers.clear()
@@ -225,9 +278,9 @@ class ProviderFactory:
             provider = provider_class()
             if provider.is_available():
                 self._providers[name] = provider
-                print(f"✅ Custom provider '{name}' added successfully")
+                logger.info("Custom provider '%s' added successfully", name)
             else:
-                print(f"⚠️ Custom provider '{name}' not available")
+                logger.warning("Custom provider '%s' not available", name)
         except Exception as e:
-            print(f"❌ Failed to add custom provider '{name}': {e}")
+            logger.error("Failed to add custom provider '%s': %s", name, e)
             raise
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""
+AI Forge - Shared Response Cache
+Caché de respuestas compartida entre workers y réplicas (Redis)
+"""
+
+import asyncio
+import os
+from typing import Optional
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Redis es opcional: sin él solo se usa la caché en memoria
+    aioredis = None
+
+
+class SharedResponseCache:
+    """
+    Caché de respuestas respaldada por Redis
+    
+    Complementa la caché en memoria de cada proveedor: con varios workers
+    (o réplicas) todos consultan las mismas entradas. Es tolerante a fallos:
+    si Redis no responde, las operaciones se comportan como un fallo de
+    caché y el chat continúa normalmente.
+    """
+    
+    KEY_PREFIX = b"ai-forge:chat:"
+    
+    def __init__(self, url: str, socket_timeout: float = 0.5):
+        self.url = url
+        self.socket_timeout = socket_timeout
+        self._redis = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    @classmethod
+    def from_env(cls) -> Optional["SharedResponseCache"]:
+        """
+        Crea la caché a partir de REDIS_URL
+        
+        Returns:
+            Instancia de la caché, o None si no hay URL o falta el paquete redis
+        """
+        url = os.getenv("REDIS_URL")
+        if not url or aioredis is None:
+            return None
+        return cls(url)
+    
+    def _client(self):
+        """Cliente Redis del event loop actual (las conexiones no se comparten entre loops)"""
+        loop = asyncio.get_running_loop()
+        if self._redis is None or self._loop is not loop:
+            self._redis = aioredis.Redis.from_url(
+                self.url,
+                decode_responses=False,
+                socket_timeout=self.socket_timeout,
+                socket_connect_timeout=self.socket_timeout
+            )
+            self._loop = loop
+        return self._redis
+    
+    async def get(self, key: bytes) -> Optional[str]:
+        """
+        Obtiene una respuesta cacheada
+        
+        Args:
+            key: Clave binaria (ver BaseAIProvider._cache_digest)
+            
+        Returns:
+            Respuesta cacheada o None
+        """
+        try:
+            value = await self._client().get(self.KEY_PREFIX + key)
+        except Exception:
+            return None
+        return value.decode("utf-8") if value is not None else None
+    
+    async def set(self, key: bytes, response: str, ttl: int):
+        """
+        Guarda una respuesta con expiración (SETEX)
+        
+        Args:
+            key: Clave binaria
+            response: Respuesta a guardar
+            ttl: Segundos de vida
+        """
+        try:
+            await self._client().setex(self.KEY_PREFIX + key, ttl, response.encode("utf-8"))
+        except Exception:
+            pass
+    
+    async def aclose(self):
+        """Cierra las conexiones con Redis"""
+        client, self._redis, self._loop = self._redis, None, None
+        if client is not None:
+            try:
+                await client.aclose()
+            except Exception:
+                pass
@@ -5,19 +5,35 @@ Núcleo reutilizable para crear aplicaciones especializadas de IA
 
 from fastapi import FastAPI, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.responses import (
+    FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
+)
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, Callable
 import asyncio
 import json
 import os
+import time
 from datetime import datetime
 
+from .json_utils import dumps as json_dumps
 from .config_manager import ConfigManager
 from .prompts_manager import PromptsManager
 from .ai_providers.provider_factory import ProviderFactory
 
 
+class _JSONResponse(JSONResponse):
+    """Respuesta JSON serializada con json_utils (orjson cuando está instalado)"""
+    
+    def render(self, content: Any) -> bytes:
+        return json_dumps(content)
+
+
+# Cabeceras de las respuestas en streaming: evitan que un proxy inverso
+# (nginx, etc.) acumule el cuerpo en buffer antes de reenviarlo
+_STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
 class SavePromptRequest(BaseModel):
     name: str
     prompt: str
@@ -55,7 +71,12 @@ class BaseAIApp:
         custom_routes: Optional[Callable] = None
     ):
         self.app_name = app_name
-        self.app = FastAPI(title=f"AI Forge - {app_name}")
+        self.app = FastAPI(title=f"AI Forge - {app_name}", default_response_class=_JSONResponse)
+        # Acceso a la app AI Forge desde handlers definidos a nivel de módulo
+        self.app.state.ai_app = self
+        
+        # Cuerpo de /health cacheado por segundo: (segundo, bytes)
+        self._health_cache = (0, b"")
         
         # Inicializar gestores
         self.config = ConfigManager(f"data/{app_name}_config.json", default_config or {})
@@ -76,14 +97,23 @@ class BaseAIApp:
     def _setup_base_routes(self):
         """Configura las rutas base que todas las apps necesitan"""
         
+        @self.app.on_event("shutdown")
+        async def close_providers():
+            """Cierra los proveedores y sus conexiones HTTP compartidas"""
+            await self.providers.aclose()
+        
         @self.app.get("/health")
         async def health_check():
             """Health check endpoint"""
-            return {
-                "status": "healthy",
-                "app": self.app_name,
-                "timestamp": datetime.now().isoformat()
-            }
+            # El cuerpo solo cambia una vez por segundo: se serializa entonces
+            now = int(time.time())
+            if now != self._health_cache[0]:
+                self._health_cache = (now, json_dumps({
+                    "status": "healthy",
+                    "app": self.app_name,
+                    "timestamp": datetime.fromtimestamp(now).isoformat()
+                }))
+            return Response(content=self._health_cache[1], media_type="application/json")
         
         # === SISTEMA DE PROMPTS ===
         @self.app.get("/prompts")
@@ -113,9 +143,7 @@ class BaseAIApp:
                     raise HTTPException(status_code=404, detail="Prompt not found")
                 
                 # Actualizar configuración con el prompt
-                current_config = self.config.get()
-                current_config["system_prompt"] = prompt_data["prompt"]
-                self.config.update(current_config)
+                self.config.set("system_prompt", prompt_data["prompt"])
                 
                 # Marcar como usado
                 self.prompts.mark_used(request.prompt_id)
@@ -164,8 +192,10 @@ class BaseAIApp:
         
         # === PROVEEDORES DE IA ===
         @self.app.get("/providers")
-        async def get_available_providers():
-            """Listar proveedores de IA disponibles"""
+        async def get_available_providers(details: bool = False):
+            """Listar proveedores de IA disponibles (con details=true, su información completa)"""
+            if details:
+                return {"providers": await self.providers.get_provider_info()}
             return {"providers": self.providers.get_available_providers()}
         
         @self.app.get("/providers/{provider_name}/models")
@@ -183,12 +213,16 @@ class BaseAIApp:
         async def universal_chat(request: ChatRequest):
             """Endpoint de chat que puede usar cualquier proveedor de IA"""
             try:
-                # Obtener configuración actual
-                config = self.config.get()
+                # Leer solo las claves que la petición no trae, directamente
+                # de la configuración (get() sin clave devuelve la vista
+                # compartida y memoizada, que no debe modificarse)
+                config_get = self.config.get
                 
                 # Determinar proveedor y modelo
-                provider_name = request.provider or config.get("default_provider", "ollama")
-                model_name = request.model or config.get("default_model")
+                provider_name = request.provider or config_get("default_provider", "ollama")
+                model_name = request.model or config_get("default_model")
+                system_prompt = request.system_prompt or config_get("system_prompt")
+                temperature = request.temperature or config_get("temperature", 0.7)
                 
                 # Obtener proveedor
                 provider = self.providers.get_provider(provider_name)
@@ -197,8 +231,8 @@ class BaseAIApp:
                 chat_params = {
                     "message": request.message,
                     "model": model_name,
-                    "system_prompt": request.system_prompt or config.get("system_prompt"),
-                    "temperature": request.temperature or config.get("temperature", 0.7),
+                    "system_prompt": system_prompt,
+                    "temperature": temperature,
                     "stream": request.stream
                 }
                 
@@ -206,7 +240,8 @@ class BaseAIApp:
                 if request.stream:
                     return StreamingResponse(
                         provider.chat_stream(**chat_params),
-                        media_type="text/plain"
+                        media_type="text/event-stream",
+                        headers=_STREAM_HEADERS
                     )
                 else:
                     response = await provider.chat(**chat_params)
@@ -220,14 +255,18 @@ class BaseAIApp:
         return self.app.api_route(path, methods=[method], **kwargs)
     
     def add_page_route(self, path: str, template_path: str):
-        """Helper para agregar páginas HTML"""
+        """
+        Helper para agregar páginas HTML
+        
+        El archivo se sirve con FileResponse (sendfile cuando el servidor lo
+        soporta; ETag y Last-Modified incluidos) en lugar de leerlo en memoria
+        en cada petición.
+        """
         @self.app.get(path, response_class=HTMLResponse)
         async def serve_page():
-            try:
-                with open(template_path, "r", encoding="utf-8") as file:
-                    return HTMLResponse(content=file.read())
-            except FileNotFoundError:
+            if not os.path.isfile(template_path):
                 raise HTTPException(status_code=404, detail="Page not found")
+            return FileResponse(template_path, media_type="text/html")
     
     def get_app(self) -> FastAPI:
         """Retorna la instancia de FastAPI"""
@@ -3,11 +3,34 @@ AI Forge - Configuration Manager
 Gestiona la configuración persistente de las aplicaciones
 """
 
-import json
 import os
+import time
+import atexit
+import threading
 from typing import Dict, Any, Optional
 from datetime import datetime
 
+from .file_utils import atomic_write
+from .json_utils import JSONDecodeError, dumps_pretty as _dumps, loads as _loads
+
+# Espera (segundos) entre una modificación y la escritura a disco: las
+# modificaciones que llegan mientras tanto se guardan en la misma escritura
+_FLUSH_DELAY = 0.25
+# Espera antes de reintentar una escritura fallida
+_RETRY_FLUSH_DELAY = 5.0
+
+# Intervalo mínimo (segundos) entre comprobaciones de cambios externos del
+# archivo (un stat); get() recarga si el mtime cambió
+_RELOAD_CHECK_INTERVAL = 1.0
+
+# Reglas de validate_config: claves requeridas y (clave, tipos, nombre)
+_REQUIRED_KEYS = ('default_provider', 'default_model', 'system_prompt')
+_TYPE_CHECKS = (
+    ('temperature', (int, float), 'int or float'),
+    ('max_tokens', int, 'int'),
+    ('stream', bool, 'bool'),
+)
+
 
 class ConfigManager:
     """
@@ -18,14 +41,36 @@ class ConfigManager:
     - Valores por defecto
     - Validación básica
     - Historial de cambios
+    
+    Las escrituras a disco se agrupan: cada modificación marca la
+    configuración como pendiente y programa un flush() diferido. flush() se
+    llama también al salir del proceso.
+    
+    Si el archivo se modifica desde fuera (otro proceso, edición manual),
+    get() lo recarga al detectar el cambio de mtime, salvo que haya cambios
+    propios pendientes de escribir.
     """
     
     def __init__(self, config_file: str, defaults: Dict[str, Any] = None):
         self.config_file = config_file
         self.defaults = defaults or {}
         self._config = {}
+        # Vista sin metadata que devuelve get(); se reconstruye tras cambios
+        self._public_view: Optional[Dict[str, Any]] = None
+        self._dirty = False
+        self._flush_timer: Optional[threading.Timer] = None
+        self._flush_lock = threading.Lock()
+        # Protege _config frente al flush (hilo del timer): lo toman las
+        # modificaciones y la copia que se escribe
+        self._data_lock = threading.Lock()
+        # mtime del archivo tal como se leyó o escribió por última vez
+        self._mtime_ns: Optional[int] = None
+        # Metadata del archivo; se sella (last_updated) solo al escribir
+        self._metadata: Dict[str, Any] = {"last_updated": None, "version": "1.0"}
+        self._next_reload_check = 0.0
         self._ensure_data_dir()
         self._load_config()
+        atexit.register(self.flush)
     
     def _ensure_data_dir(self):
         """Asegura que el directorio de datos existe"""
@@ -33,41 +78,120 @@ class ConfigManager:
     
     def _load_config(self):
         """Carga la configuración desde archivo o usa defaults"""
+        self._public_view = None
         try:
             if os.path.exists(self.config_file):
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    self._config = json.load(f)
-                    
-                # Merge con defaults para asegurar que existen todas las claves
-                for key, value in self.defaults.items():
-                    if key not in self._config:
-                        self._config[key] = value
+                with open(self.config_file, 'rb') as f:
+                    mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+                    loaded = _loads(f.read())
+                self._apply_loaded(loaded, mtime_ns)
             else:
-                self._config = self.defaults.copy()
-                self._save_config()
+                with self._data_lock:
+                    self._config = self.defaults.copy()
+                self._dirty = True
+                self.flush()
                 
-        except (json.JSONDecodeError, FileNotFoundError):
+        except (JSONDecodeError, FileNotFoundError):
             print(f"Warning: Could not load config from {self.config_file}, using defaults")
-            self._config = self.defaults.copy()
-            self._save_config()
+            with self._data_lock:
+                self._config = self.defaults.copy()
+            self._dirty = True
+            self.flush()
     
-    def _save_config(self):
-        """Guarda la configuración actual al archivo"""
+    def _save_config(self, config_to_save: Dict[str, Any]) -> bool:
+        """
+        Guarda al archivo una copia de la configuración
+        
+        Returns:
+            True si se guardó
+        """
         try:
-            # Agregar metadata
-            config_to_save = {
-                **self._config,
-                "_metadata": {
-                    "last_updated": datetime.now().isoformat(),
-                    "version": "1.0"
-                }
-            }
-            
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(config_to_save, f, indent=2, ensure_ascii=False)
-                
+            atomic_write(self.config_file, _dumps(config_to_save))
+            self._mtime_ns = os.stat(self.config_file).st_mtime_ns
+            return True
         except Exception as e:
             print(f"Error saving config to {self.config_file}: {e}")
+            return False
+    
+    def _snapshot(self) -> Dict[str, Any]:
+        """Copia de la configuración a escribir, con metadata (tomar con _data_lock)"""
+        return {**self._config, "_metadata": dict(self._metadata)}
+    
+    def _apply_loaded(self, loaded: Dict[str, Any], mtime_ns: int):
+        """Sustituye la configuración en memoria por la leída del archivo"""
+        metadata = loaded.pop('_metadata', None)
+        # Merge con defaults para asegurar que existen todas las claves
+        # (si el valor guardado coincide, se comparte el objeto del
+        # default en lugar de mantener una copia leída del archivo)
+        for key, value in self.defaults.items():
+            if key not in loaded or loaded[key] == value:
+                loaded[key] = value
+        
+        with self._data_lock:
+            if isinstance(metadata, dict):
+                self._metadata.update(metadata)
+            self._config = loaded
+            self._mtime_ns = mtime_ns
+            self._public_view = None
+    
+    def _maybe_reload(self):
+        """Recarga el archivo si cambió en disco desde la última lectura/escritura"""
+        now = time.monotonic()
+        if now < self._next_reload_check:
+            return
+        self._next_reload_check = now + _RELOAD_CHECK_INTERVAL
+        
+        try:
+            if os.stat(self.config_file).st_mtime_ns == self._mtime_ns or self._dirty:
+                return
+            with open(self.config_file, 'rb') as f:
+                mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+                loaded = _loads(f.read())
+        except (OSError, JSONDecodeError):
+            # Archivo ausente o a medio escribir: se mantiene la configuración
+            # actual y se reintenta en la siguiente comprobación
+            return
+        
+        if isinstance(loaded, dict):
+            self._apply_loaded(loaded, mtime_ns)
+    
+    def _schedule_flush(self, delay: float = _FLUSH_DELAY):
+        """
+        Marca la configuración como pendiente y programa su escritura
+        
+        Se llama después de modificar _config y fuera de _data_lock.
+        """
+        self._dirty = True
+        with self._flush_lock:
+            self._start_flush_timer(delay)
+    
+    def _start_flush_timer(self, delay: float):
+        """Programa un flush() si no hay uno programado (tomar con _flush_lock)"""
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(delay, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+    
+    def flush(self):
+        """
+        Escribe a disco los cambios pendientes (no hace nada si no los hay)
+        
+        Escribe una copia tomada bajo _data_lock; si la escritura falla, los
+        cambios siguen pendientes y se reintenta más tarde.
+        """
+        with self._flush_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            with self._data_lock:
+                if not self._dirty:
+                    return
+                self._dirty = False
+                self._metadata["last_updated"] = datetime.now().isoformat()
+                config_to_save = self._snapshot()
+            if not self._save_config(config_to_save):
+                self._dirty = True
+                self._start_flush_timer(_RETRY_FLUSH_DELAY)
     
     def get(self, key: Optional[str] = None, default: Any = None) -> Any:
         """
@@ -78,11 +202,16 @@ class ConfigManager:
             default: Valor por defecto si la clave no existe
             
         Returns:
-            Valor de configuración o config completa
+            Valor de configuración o config completa (sin metadata). La
+            config completa se memoiza hasta la siguiente modificación y es
+            compartida: no debe modificarse; para cambiarla, usar set/update.
         """
+        self._maybe_reload()
+        
         if key is None:
-            # Retorna copia sin metadata
-            return {k: v for k, v in self._config.items() if not k.startswith('_')}
+            if self._public_view is None:
+                self._public_view = {k: v for k, v in self._config.items() if not k.startswith('_')}
+            return self._public_view
         
         return self._config.get(key, default)
     
@@ -99,8 +228,10 @@ class ConfigManager:
         # Filtrar metadata
         filtered_updates = {k: v for k, v in updates.items() if not k.startswith('_')}
         
-        self._config.update(filtered_updates)
-        self._save_config()
+        with self._data_lock:
+            self._config.update(filtered_updates)
+            self._public_view = None
+        self._schedule_flush()
         
         return self.get()
     
@@ -116,8 +247,10 @@ class ConfigManager:
             Valor establecido
         """
         if not key.startswith('_'):
-            self._config[key] = value
-            self._save_config()
+            with self._data_lock:
+                self._config[key] = value
+                self._public_view = None
+            self._schedule_flush()
         
         return value
     
@@ -128,14 +261,16 @@ class ConfigManager:
         Args:
             keys: Lista de claves específicas a resetear (si None, resetea todo)
         """
-        if keys is None:
-            self._config = self.defaults.copy()
-        else:
-            for key in keys:
-                if key in self.defaults:
-                    self._config[key] = self.defaults[key]
-        
-        self._save_config()
+        with self._data_lock:
+            if keys is None:
+                self._config = self.defaults.copy()
+            else:
+                for key in keys:
+                    if key in self.defaults:
+                        self._config[key] = self.defaults[key]
+            
+            self._public_view = None
+        self._schedule_flush()
     
     def backup(self, backup_path: Optional[str] = None) -> str:
         """
@@ -148,9 +283,12 @@ class ConfigManager:
             Ruta del archivo de backup creado
         """
         if backup_path is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            timestamp = time.strftime("%Y%m%d_%H%M%S")
             backup_path = f"{self.config_file}.backup_{timestamp}"
         
+        # El backup debe incluir los cambios aún no escritos
+        self.flush()
+        
         try:
             import shutil
             shutil.copy2(self.config_file, backup_path)
@@ -167,6 +305,9 @@ class ConfigManager:
         """
         try:
             import shutil
+            # Escribir antes lo pendiente para que un flush diferido no
+            # sobrescriba después el archivo restaurado
+            self.flush()
             shutil.copy2(backup_path, self.config_file)
             self._load_config()
         except Exception as e:
@@ -179,7 +320,7 @@ class ConfigManager:
         Returns:
             Diccionario con metadata e información
         """
-        metadata = self._config.get('_metadata', {})
+        metadata = self._metadata
         
         return {
             "config_file": self.config_file,
@@ -201,23 +342,18 @@ class ConfigManager:
         issues = []
         warnings = []
         
+        config = self._config
+        
         # Verificar claves requeridas
-        required_keys = ['default_provider', 'default_model', 'system_prompt']
-        for key in required_keys:
-            if not self.get(key):
+        for key in _REQUIRED_KEYS:
+            if not config.get(key):
                 issues.append(f"Missing required key: {key}")
         
         # Verificar tipos de datos
-        type_checks = {
-            'temperature': (int, float),
-            'max_tokens': int,
-            'stream': bool
-        }
-        
-        for key, expected_type in type_checks.items():
-            value = self.get(key)
+        for key, expected_type, type_name in _TYPE_CHECKS:
+            value = config.get(key)
             if value is not None and not isinstance(value, expected_type):
-                warnings.append(f"Key '{key}' should be {expected_type.__name__}, got {type(value).__name__}")
+                warnings.append(f"Key '{key}' should be {type_name}, got {type(value).__name__}")
         
         return {
             "valid": len(issues) == 0,
@@ -0,0 +1,48 @@
+"""
+AI Forge - File Utilities
+Escritura de archivos de datos sin dejar archivos a medio escribir
+"""
+
+import os
+import stat
+import tempfile
+
+
+def atomic_write(path: str, data: bytes):
+    """
+    Escribe un archivo de forma atómica
+    
+    Los datos se escriben en un temporal del mismo directorio que después
+    reemplaza al destino con os.replace: un lector (o un fallo a mitad de
+    escritura) ve el archivo anterior completo o el nuevo, nunca uno truncado.
+    No hace fsync: protege frente a fallos del proceso, pero ante un corte de
+    luz lo escrito depende del sistema de archivos (son datos regenerables).
+    
+    Args:
+        path: Ruta del archivo destino
+        data: Contenido completo del archivo
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+        
+        # mkstemp crea el temporal con permisos 0600: conservar los del destino
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = 0o644
+        os.chmod(tmp_path, mode)
+        
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,78 @@
+"""
+AI Forge - JSON Utilities
+Serialización JSON rápida con orjson y fallback a la librería estándar
+"""
+
+import json
+import dataclasses
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa json
+    orjson = None
+
+
+HAS_ORJSON = orjson is not None
+
+# Excepción de parseo común a ambas implementaciones
+JSONDecodeError = orjson.JSONDecodeError if HAS_ORJSON else json.JSONDecodeError
+
+
+def _default(obj: Any) -> Any:
+    """Serializa dataclasses con json, como hace orjson de forma nativa"""
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Serializa un objeto a JSON compacto en UTF-8
+    
+    Args:
+        obj: Objeto serializable
+        
+    Returns:
+        JSON codificado como bytes
+    """
+    if HAS_ORJSON:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def dumps_pretty(obj: Any) -> bytes:
+    """
+    Serializa un objeto a JSON indentado (2 espacios) en UTF-8
+    
+    Pensado para archivos que se leen a mano (configuración, prompts).
+    
+    Args:
+        obj: Objeto serializable
+        
+    Returns:
+        JSON codificado como bytes
+    """
+    if HAS_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, indent=2, ensure_ascii=False, default=_default).encode("utf-8")
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """
+    Parsea JSON desde bytes o str
+    
+    Args:
+        data: Documento JSON
+        
+    Returns:
+        Objeto Python resultante
+        
+    Raises:
+        JSONDecodeError: Si el documento no es JSON válido
+    """
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
@@ -3,12 +3,172 @@ AI Forge - Prompts Manager
 Sistema universal de gestión de prompts para aplicaciones especializadas
 """
 
-import json
 import os
-import uuid
-from typing import Dict, List, Optional, Any
+import copy
+import mmap
+import time
+import secrets
+from types import MappingProxyType
+import atexit
+import threading
+from dataclasses import dataclass, field, fields
+from typing import Dict, List, Optional, Any, Set, Tuple, Iterator, Mapping
 from datetime import datetime
 
+try:
+    import ijson
+except ImportError:  # ijson es opcional: sin él las importaciones se leen completas
+    ijson = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard es opcional: sin él los prompts se guardan sin comprimir
+    zstandard = None
+
+from .file_utils import atomic_write
+from .json_utils import JSONDecodeError, dumps_pretty as _dumps, loads as _loads
+
+# Espera (segundos) entre una modificación y la escritura a disco; mark_used,
+# la modificación más frecuente, espera más para agrupar más usos
+_FLUSH_DELAY = 0.25
+_MARK_USED_FLUSH_DELAY = 1.0
+# Espera antes de reintentar una escritura fallida
+_RETRY_FLUSH_DELAY = 5.0
+
+# A partir de este tamaño el archivo se parsea desde un mmap, sin copiarlo
+# antes a un buffer de Python
+_MMAP_THRESHOLD = 256 * 1024
+
+# A partir de este tamaño import_prompts lee el archivo en streaming (ijson)
+_STREAM_IMPORT_THRESHOLD = 4 * 1024 * 1024
+
+# A partir de este tamaño los prompts se guardan comprimidos con zstd
+# (prompts_file + '.zst'), si zstandard está instalado
+_ZSTD_THRESHOLD = 64 * 1024
+_ZSTD_LEVEL = 3
+
+# Tipo de los campos de PromptRecord que se validan al cargar y actualizar;
+# con otro tipo se usa el valor por defecto (el tipo sin argumentos)
+_FIELD_TYPES = {'name': str, 'prompt': str, 'tags': list, 'use_count': int}
+
+# Errores de lectura tras los que se empieza con los prompts vacíos
+# (solo del archivo plano: si el .zst no se puede leer no se carga nada)
+_LOAD_ERRORS = (JSONDecodeError, FileNotFoundError)
+
+
+def _last_used_ns(value: Any) -> Optional[int]:
+    """
+    Normaliza last_used a nanosegundos desde epoch (time.time_ns)
+    
+    Acepta también el formato ISO de versiones anteriores.
+    """
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value)
+    try:
+        return int(datetime.fromisoformat(value).timestamp() * 1_000_000_000)
+    except (TypeError, ValueError):
+        return None
+
+
+def _coerce_field(key: str, value: Any) -> Any:
+    """
+    Sustituye por su valor por defecto un campo con tipo incorrecto
+    
+    Cubre los campos de los que dependen los índices y las estadísticas
+    (p. ej. "tags": null o "use_count": null en el archivo).
+    """
+    expected = _FIELD_TYPES.get(key)
+    if expected is None or (isinstance(value, expected) and not isinstance(value, bool)):
+        return value
+    if expected is list and isinstance(value, (tuple, set, frozenset)):
+        return list(value)
+    return expected()
+
+
+def _ns_to_iso(value: Optional[int]) -> Optional[str]:
+    """Formatea un last_used en nanosegundos como fecha ISO"""
+    return datetime.fromtimestamp(value / 1_000_000_000).isoformat() if value else None
+
+
+def _copy_prompt_data(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Copia los datos de un prompt y sus listas/diccionarios (tags, variables...)"""
+    return {k: v.copy() if isinstance(v, (list, dict)) else v for k, v in data.items()}
+
+
+@dataclass(slots=True)
+class PromptRecord:
+    """
+    Datos de un prompt guardado
+    
+    Es la representación interna; en el archivo se guarda to_storage() y
+    los métodos públicos de PromptsManager devuelven to_dict().
+    """
+    id: str
+    # Con valor por defecto para tolerar registros incompletos en el archivo
+    name: str = ""
+    prompt: str = ""
+    description: str = ""
+    category: Optional[str] = "general"
+    tags: List[str] = field(default_factory=list)
+    created_at: Optional[str] = None
+    # Nanosegundos desde epoch (time.time_ns)
+    last_used: Optional[int] = None
+    use_count: int = 0
+    version: str = "1.0"
+    modified_at: Optional[str] = None
+    # Campos que no son de PromptRecord (añadidos a mano o por otras
+    # versiones): se conservan y se guardan junto a los demás
+    extra: Dict[str, Any] = field(default_factory=dict)
+    
+    @classmethod
+    def from_dict(cls, prompt_id: str, data: Dict[str, Any]) -> "PromptRecord":
+        """
+        Crea un registro a partir de los datos leídos de un archivo
+        
+        Guarda los campos desconocidos en extra, completa los que falten o
+        tengan un tipo incorrecto con su valor por defecto y normaliza
+        last_used (los archivos antiguos lo guardan en ISO).
+        """
+        known, extra = {}, {}
+        for k, v in data.items():
+            if k in _RECORD_FIELDS:
+                known[k] = _coerce_field(k, v)
+            else:
+                extra[k] = v
+        known.pop('id', None)
+        record = cls(**known, id=data.get('id') or prompt_id, extra=extra)
+        if record.last_used is not None and not isinstance(record.last_used, int):
+            record.last_used = _last_used_ns(record.last_used)
+        return record
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Datos del prompt como diccionario nuevo, con last_used en ISO
+        
+        Es la forma que se expone (API, exportaciones): un entero en
+        nanosegundos supera 2**53 y pierde precisión en clientes JavaScript.
+        """
+        data = {name: getattr(self, name) for name in _RECORD_FIELD_NAMES}
+        data['tags'] = list(self.tags or ())
+        data['last_used'] = _ns_to_iso(self.last_used)
+        if self.extra:
+            data.update(copy.deepcopy(self.extra))
+        return data
+    
+    def to_storage(self) -> Dict[str, Any]:
+        """Datos del prompt tal como se guardan en el archivo (last_used en ns)"""
+        data = {name: getattr(self, name) for name in _RECORD_FIELD_NAMES}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+# Campos propios de PromptRecord (sin extra, que guarda el resto)
+_RECORD_FIELD_NAMES = tuple(f.name for f in fields(PromptRecord) if f.name != 'extra')
+_RECORD_FIELDS = frozenset(_RECORD_FIELD_NAMES)
+
 
 class PromptsManager:
     """
@@ -20,39 +180,299 @@ class PromptsManager:
     - Historial de uso
     - Búsqueda y filtrado
     - Importación/exportación
+    
+    Las escrituras a disco se agrupan: cada modificación marca los prompts
+    como pendientes y programa un flush() diferido. flush() se llama también
+    al salir del proceso.
     """
     
     def __init__(self, prompts_file: str):
         self.prompts_file = prompts_file
-        self._prompts = {}
+        # Versión comprimida del archivo, usada cuando supera _ZSTD_THRESHOLD
+        self.compressed_file = prompts_file + '.zst'
+        # Archivo del que se leyeron (o al que se escribieron por última vez)
+        # los prompts: el único del otro formato que _save_prompts puede borrar
+        self._source_file: Optional[str] = None
+        # Los prompts se leen del archivo en el primer acceso (_ensure_loaded)
+        self._prompts: Optional[Dict[str, PromptRecord]] = None
+        
+        # Índices para search: categoría -> ids, etiqueta -> ids y texto
+        # buscable (nombre, descripción y contenido en minúsculas, como bytes
+        # UTF-8) por id
+        self._by_category: Dict[Any, Set[str]] = {}
+        self._by_tag: Dict[str, Set[str]] = {}
+        self._search_bytes: Dict[str, bytes] = {}
+        # Orden de inserción de cada id, para que los candidatos de los
+        # índices (conjuntos) se recorran en el mismo orden que _prompts
+        self._position: Dict[str, int] = {}
+        self._next_position = 0
+        
+        # Estadísticas de uso, mantenidas de forma incremental; si un cambio
+        # no permite actualizarlas así, se marcan para recalcular (una pasada)
+        self._total_uses = 0
+        self._most_used_id: Optional[str] = None
+        self._recent_used_id: Optional[str] = None
+        self._usage_stale = True
+        
+        # Contador de modificaciones: get_stats/get_categories/get_tags
+        # memoizan su resultado mientras no cambie
+        self._gen = 0
+        self._stats_cache: Optional[Tuple[int, Dict[str, Any]]] = None
+        self._categories_cache: Optional[Tuple[int, List[str]]] = None
+        self._tags_cache: Optional[Tuple[int, List[str]]] = None
+        # to_dict() de cada prompt para get_all; las modificaciones marcan
+        # solo el id afectado para reconstruirlo
+        self._all_cache: Optional[Dict[str, Dict[str, Any]]] = None
+        self._all_stale: Set[str] = set()
+        
+        self._dirty = False
+        self._flush_timer: Optional[threading.Timer] = None
+        self._flush_lock = threading.Lock()
+        # Protege _prompts y sus registros frente al flush (hilo del timer):
+        # lo toman las modificaciones y la copia que se escribe
+        self._data_lock = threading.Lock()
         self._ensure_data_dir()
-        self._load_prompts()
+        atexit.register(self.flush)
     
     def _ensure_data_dir(self):
         """Asegura que el directorio de datos existe"""
         os.makedirs(os.path.dirname(self.prompts_file), exist_ok=True)
     
+    def _ensure_loaded(self):
+        """Carga los prompts del archivo si aún no se han cargado"""
+        if self._prompts is None:
+            self._load_prompts()
+    
     def _load_prompts(self):
-        """Carga prompts desde archivo"""
+        """
+        Carga prompts desde archivo (el comprimido si es el más reciente)
+        
+        Raises:
+            RuntimeError: Si hay que leer el archivo comprimido y no se puede
+                (zstandard no instalado o archivo dañado); no se empieza con
+                los prompts vacíos para no sobrescribirlo
+        """
+        if self._use_compressed_file():
+            try:
+                with open(self.compressed_file, 'rb') as f:
+                    loaded = _loads(zstandard.ZstdDecompressor().decompress(f.read()))
+            except (zstandard.ZstdError, JSONDecodeError, OSError) as e:
+                raise RuntimeError(f"Could not load prompts from {self.compressed_file}: {e}") from e
+            self._prompts = self._records_from_file(loaded)
+            self._source_file = self.compressed_file
+            self._rebuild_indexes()
+            self.flush()
+            return
+        
         try:
             if os.path.exists(self.prompts_file):
-                with open(self.prompts_file, 'r', encoding='utf-8') as f:
-                    self._prompts = json.load(f)
+                with open(self.prompts_file, 'rb') as f:
+                    if os.fstat(f.fileno()).st_size > _MMAP_THRESHOLD:
+                        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                            with memoryview(mm) as view:
+                                loaded = _loads(view)
+                    else:
+                        loaded = _loads(f.read())
             else:
+                loaded = None
                 self._prompts = {}
-                self._save_prompts()
-        except (json.JSONDecodeError, FileNotFoundError):
+                self._dirty = True
+            if loaded is not None:
+                self._prompts = self._records_from_file(loaded)
+                self._source_file = self.prompts_file
+        except _LOAD_ERRORS:
             print(f"Warning: Could not load prompts from {self.prompts_file}, starting fresh")
             self._prompts = {}
-            self._save_prompts()
+            self._dirty = True
+            self._source_file = self.prompts_file
+        
+        self._rebuild_indexes()
+        self.flush()
+    
+    def _records_from_file(self, loaded: Any) -> Dict[str, PromptRecord]:
+        """
+        Convierte el contenido del archivo en registros
+        
+        Las entradas que no son un objeto JSON (o el documento entero, si no
+        lo es) se descartan con un aviso.
+        """
+        if not isinstance(loaded, dict):
+            print(f"Warning: Could not load prompts from {self.prompts_file}, starting fresh")
+            return {}
+        prompts = {}
+        for prompt_id, prompt_data in loaded.items():
+            if not isinstance(prompt_data, dict):
+                print(f"Warning: Skipping malformed prompt {prompt_id!r} in {self.prompts_file}")
+                continue
+            prompts[prompt_id] = PromptRecord.from_dict(prompt_id, prompt_data)
+        return prompts
+    
+    def _rebuild_indexes(self):
+        """Reconstruye índices y estadísticas de uso"""
+        self._by_category = {}
+        self._by_tag = {}
+        self._search_bytes = {}
+        self._position = {}
+        self._next_position = 0
+        self._rebuild_usage(index=True)
+        self._all_cache = None
+        self._all_stale = set()
+        self._gen += 1
+    
+    def _rebuild_usage(self, index: bool = False):
+        """
+        Recalcula en una sola pasada las estadísticas de uso
+        
+        Con index=True la misma pasada agrega cada prompt a los índices.
+        """
+        total_uses = 0
+        most_used_id, most_uses = None, 0
+        recent_used_id, recent_ts = None, None
+        for prompt_id, record in self._prompts.items():
+            if index:
+                self._index_prompt(prompt_id, record)
+            
+            use_count = record.use_count
+            total_uses += use_count
+            if use_count > most_uses:
+                most_used_id, most_uses = prompt_id, use_count
+            last_used = record.last_used
+            if last_used and (recent_ts is None or last_used > recent_ts):
+                recent_used_id, recent_ts = prompt_id, last_used
+        
+        self._total_uses = total_uses
+        self._most_used_id = most_used_id
+        self._recent_used_id = recent_used_id
+        self._usage_stale = False
+    
+    def _index_prompt(self, prompt_id: str, record: PromptRecord):
+        """Agrega un prompt a los índices de búsqueda"""
+        if prompt_id not in self._position:
+            self._position[prompt_id] = self._next_position
+            self._next_position += 1
+        self._by_category.setdefault(record.category, set()).add(prompt_id)
+        for tag in record.tags or ():
+            self._by_tag.setdefault(tag, set()).add(prompt_id)
+        self._search_bytes[prompt_id] = (
+            (record.name or '') + ' ' +
+            (record.description or '') + ' ' +
+            (record.prompt or '')
+        ).lower().encode('utf-8')
+    
+    def _unindex_prompt(self, prompt_id: str, record: PromptRecord):
+        """Quita un prompt de los índices de búsqueda"""
+        category = record.category
+        ids = self._by_category.get(category)
+        if ids is not None:
+            ids.discard(prompt_id)
+            if not ids:
+                del self._by_category[category]
+        for tag in record.tags or ():
+            ids = self._by_tag.get(tag)
+            if ids is not None:
+                ids.discard(prompt_id)
+                if not ids:
+                    del self._by_tag[tag]
+        self._search_bytes.pop(prompt_id, None)
+    
+    def _invalidate_entry(self, prompt_id: str):
+        """Marca para reconstruir la entrada de get_all de un prompt"""
+        if self._all_cache is not None:
+            self._all_stale.add(prompt_id)
+    
+    def _use_compressed_file(self) -> bool:
+        """
+        Indica si hay que leer el archivo comprimido en lugar del plano
+        
+        Si existen los dos (una escritura interrumpida antes de borrar el
+        anterior) se usa el más reciente.
+        
+        Raises:
+            RuntimeError: Si hay que leer el comprimido y zstandard no está
+                instalado
+        """
+        try:
+            compressed_mtime = os.stat(self.compressed_file).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        try:
+            use_compressed = compressed_mtime >= os.stat(self.prompts_file).st_mtime_ns
+        except FileNotFoundError:
+            use_compressed = True
+        if use_compressed and zstandard is None:
+            raise RuntimeError(
+                f"Prompts are stored in {self.compressed_file}; "
+                "install zstandard to load them"
+            )
+        return use_compressed
     
-    def _save_prompts(self):
-        """Guarda prompts al archivo"""
+    def _save_prompts(self, prompts: Dict[str, PromptRecord]) -> bool:
+        """
+        Guarda al archivo una copia de los prompts
+        
+        Por encima de _ZSTD_THRESHOLD se escribe comprimido; después se borra
+        el archivo del otro formato si es del que se cargaron los prompts, de
+        modo que un archivo plano se migra a .zst en la primera escritura (y
+        al revés si vuelve a ser pequeño).
+        
+        Returns:
+            True si se guardó
+        """
         try:
-            with open(self.prompts_file, 'w', encoding='utf-8') as f:
-                json.dump(self._prompts, f, indent=2, ensure_ascii=False)
+            data = _dumps({prompt_id: record.to_storage() for prompt_id, record in prompts.items()})
+            if zstandard is not None and len(data) > _ZSTD_THRESHOLD:
+                atomic_write(self.compressed_file,
+                             zstandard.ZstdCompressor(level=_ZSTD_LEVEL).compress(data))
+                written_file, stale_file = self.compressed_file, self.prompts_file
+            else:
+                atomic_write(self.prompts_file, data)
+                written_file, stale_file = self.prompts_file, self.compressed_file
+            # Un archivo que no es el cargado puede tener datos que no están
+            # en memoria: no se borra
+            if stale_file == self._source_file and os.path.exists(stale_file):
+                os.remove(stale_file)
+            self._source_file = written_file
+            return True
         except Exception as e:
             print(f"Error saving prompts to {self.prompts_file}: {e}")
+            return False
+    
+    def _schedule_flush(self, delay: float = _FLUSH_DELAY):
+        """
+        Marca los prompts como pendientes y programa su escritura
+        
+        Se llama después de modificar los prompts y fuera de _data_lock.
+        """
+        self._dirty = True
+        with self._flush_lock:
+            self._start_flush_timer(delay)
+    
+    def _start_flush_timer(self, delay: float):
+        """Programa un flush() si no hay uno programado (tomar con _flush_lock)"""
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(delay, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+    
+    def flush(self):
+        """
+        Escribe a disco los cambios pendientes (no hace nada si no los hay)
+        
+        Escribe una copia tomada bajo _data_lock; si la escritura falla, los
+        cambios siguen pendientes y se reintenta más tarde.
+        """
+        with self._flush_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            with self._data_lock:
+                if not self._dirty or self._prompts is None:
+                    return
+                self._dirty = False
+                prompts = {prompt_id: copy.copy(record) for prompt_id, record in self._prompts.items()}
+            if not self._save_prompts(prompts):
+                self._dirty = True
+                self._start_flush_timer(_RETRY_FLUSH_DELAY)
     
     def save(self, name: str, prompt: str, description: str = "", 
              category: str = "general", tags: List[str] = None) -> Dict[str, Any]:
@@ -69,25 +489,34 @@ class PromptsManager:
         Returns:
             Diccionario con los datos del prompt guardado
         """
-        prompt_id = str(uuid.uuid4())
-        
-        prompt_data = {
-            "id": prompt_id,
-            "name": name,
-            "prompt": prompt,
-            "description": description,
-            "category": category,
-            "tags": tags or [],
-            "created_at": datetime.now().isoformat(),
-            "last_used": None,
-            "use_count": 0,
-            "version": "1.0"
-        }
+        self._ensure_loaded()
         
-        self._prompts[prompt_id] = prompt_data
-        self._save_prompts()
+        record = self._insert(name, prompt, description, category, tags)
+        self._schedule_flush()
         
-        return prompt_data
+        return record.to_dict()
+    
+    def _insert(self, name: str, prompt: str, description: str,
+                category: str, tags: Optional[List[str]]) -> PromptRecord:
+        """Agrega un prompt nuevo sin programar su escritura"""
+        prompt_id = secrets.token_hex(16)
+        
+        record = PromptRecord(
+            id=prompt_id,
+            name=name,
+            prompt=prompt,
+            description=description,
+            category=category,
+            tags=tags or [],
+            created_at=datetime.now().isoformat()
+        )
+        
+        with self._data_lock:
+            self._prompts[prompt_id] = record
+        self._index_prompt(prompt_id, record)
+        self._invalidate_entry(prompt_id)
+        self._gen += 1
+        return record
     
     def get(self, prompt_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -99,16 +528,35 @@ class PromptsManager:
         Returns:
             Datos del prompt o None si no existe
         """
-        return self._prompts.get(prompt_id)
+        self._ensure_loaded()
+        
+        record = self._prompts.get(prompt_id)
+        return record.to_dict() if record is not None else None
     
-    def get_all(self) -> Dict[str, Dict[str, Any]]:
+    def get_all(self) -> Mapping[str, Dict[str, Any]]:
         """
         Obtiene todos los prompts
         
         Returns:
-            Diccionario con todos los prompts
+            Vista de solo lectura de todos los prompts, con copias de sus
+            datos (no refleja los cambios posteriores)
         """
-        return self._prompts.copy()
+        self._ensure_loaded()
+        
+        if self._all_cache is None:
+            self._all_cache = {prompt_id: record.to_dict() for prompt_id, record in self._prompts.items()}
+            self._all_stale.clear()
+        elif self._all_stale:
+            for prompt_id in self._all_stale:
+                record = self._prompts.get(prompt_id)
+                if record is None:
+                    self._all_cache.pop(prompt_id, None)
+                else:
+                    self._all_cache[prompt_id] = record.to_dict()
+            self._all_stale.clear()
+        return MappingProxyType({
+            prompt_id: _copy_prompt_data(data) for prompt_id, data in self._all_cache.items()
+        })
     
     def update(self, prompt_id: str, **updates) -> Dict[str, Any]:
         """
@@ -116,7 +564,8 @@ class PromptsManager:
         
         Args:
             prompt_id: ID del prompt
-            **updates: Campos a actualizar
+            **updates: Campos a actualizar (los que no son de PromptRecord
+                se guardan en extra)
             
         Returns:
             Prompt actualizado
@@ -124,20 +573,49 @@ class PromptsManager:
         Raises:
             KeyError: Si el prompt no existe
         """
+        self._ensure_loaded()
+        
         if prompt_id not in self._prompts:
             raise KeyError(f"Prompt {prompt_id} not found")
         
+        record = self._apply_updates(prompt_id, updates)
+        self._schedule_flush()
+        
+        return record.to_dict()
+    
+    def _apply_updates(self, prompt_id: str, updates: Dict[str, Any]) -> PromptRecord:
+        """Actualiza un prompt existente sin programar su escritura"""
         # Filtrar campos que no se pueden actualizar
         forbidden_fields = {'id', 'created_at', 'use_count'}
-        allowed_updates = {k: v for k, v in updates.items() if k not in forbidden_fields}
+        allowed_updates = {}
+        extra_updates = {}
+        for k, v in updates.items():
+            if k in forbidden_fields:
+                continue
+            if k in _RECORD_FIELDS:
+                allowed_updates[k] = _coerce_field(k, v)
+            else:
+                extra_updates[k] = v
         
         # Actualizar timestamp de modificación
         allowed_updates['modified_at'] = datetime.now().isoformat()
-        
-        self._prompts[prompt_id].update(allowed_updates)
-        self._save_prompts()
-        
-        return self._prompts[prompt_id]
+        if 'last_used' in allowed_updates:
+            allowed_updates['last_used'] = _last_used_ns(allowed_updates['last_used'])
+        
+        record = self._prompts[prompt_id]
+        self._unindex_prompt(prompt_id, record)
+        with self._data_lock:
+            for key, value in allowed_updates.items():
+                setattr(record, key, value)
+            if extra_updates:
+                # Diccionario nuevo: el flush en curso puede estar leyendo el anterior
+                record.extra = {**record.extra, **extra_updates}
+        self._index_prompt(prompt_id, record)
+        if 'last_used' in allowed_updates:
+            self._usage_stale = True
+        self._invalidate_entry(prompt_id)
+        self._gen += 1
+        return record
     
     def delete(self, prompt_id: str) -> Dict[str, Any]:
         """
@@ -152,13 +630,23 @@ class PromptsManager:
         Raises:
             KeyError: Si el prompt no existe
         """
+        self._ensure_loaded()
+        
         if prompt_id not in self._prompts:
             raise KeyError(f"Prompt {prompt_id} not found")
         
-        deleted_prompt = self._prompts.pop(prompt_id)
-        self._save_prompts()
-        
-        return deleted_prompt
+        with self._data_lock:
+            deleted_prompt = self._prompts.pop(prompt_id)
+        self._unindex_prompt(prompt_id, deleted_prompt)
+        self._position.pop(prompt_id, None)
+        self._total_uses -= deleted_prompt.use_count
+        if prompt_id == self._most_used_id or prompt_id == self._recent_used_id:
+            self._usage_stale = True
+        self._invalidate_entry(prompt_id)
+        self._gen += 1
+        self._schedule_flush()
+        
+        return deleted_prompt.to_dict()
     
     def mark_used(self, prompt_id: str):
         """
@@ -167,10 +655,27 @@ class PromptsManager:
         Args:
             prompt_id: ID del prompt
         """
-        if prompt_id in self._prompts:
-            self._prompts[prompt_id]['last_used'] = datetime.now().isoformat()
-            self._prompts[prompt_id]['use_count'] = self._prompts[prompt_id].get('use_count', 0) + 1
-            self._save_prompts()
+        self._ensure_loaded()
+        
+        record = self._prompts.get(prompt_id)
+        if record is not None:
+            with self._data_lock:
+                record.last_used = time.time_ns()
+                record.use_count += 1
+            use_count = record.use_count
+            
+            # Estadísticas incrementales
+            self._total_uses += 1
+            self._recent_used_id = prompt_id
+            most_used = self._prompts.get(self._most_used_id)
+            if most_used is None or use_count > most_used.use_count:
+                self._most_used_id = prompt_id
+            
+            # Categorías y etiquetas no cambian: solo se invalidan las
+            # estadísticas y la entrada de get_all de este prompt
+            self._stats_cache = None
+            self._invalidate_entry(prompt_id)
+            self._schedule_flush(_MARK_USED_FLUSH_DELAY)
     
     def search(self, query: str, category: str = None, tags: List[str] = None) -> List[Dict[str, Any]]:
         """
@@ -184,69 +689,77 @@ class PromptsManager:
         Returns:
             Lista de prompts que coinciden con la búsqueda
         """
-        results = []
-        query_lower = query.lower() if query else ""
+        self._ensure_loaded()
         
-        for prompt_data in self._prompts.values():
-            # Filtro por categoría
-            if category and prompt_data.get('category') != category:
-                continue
-            
-            # Filtro por etiquetas
-            if tags:
-                prompt_tags = prompt_data.get('tags', [])
-                if not any(tag in prompt_tags for tag in tags):
-                    continue
-            
-            # Búsqueda de texto
-            if query:
-                searchable_text = (
-                    prompt_data.get('name', '') + ' ' +
-                    prompt_data.get('description', '') + ' ' +
-                    prompt_data.get('prompt', '')
-                ).lower()
-                
-                if query_lower not in searchable_text:
-                    continue
-            
-            results.append(prompt_data)
+        query_bytes = query.lower().encode('utf-8') if query else b""
+        
+        # Candidatos según los índices de categoría y etiquetas
+        candidates: Optional[Set[str]] = None
+        if category:
+            candidates = self._by_category.get(category, set())
+        if tags:
+            tagged = set().union(*(self._by_tag.get(tag, ()) for tag in tags))
+            candidates = tagged if candidates is None else candidates & tagged
+        
+        # Búsqueda de texto solo sobre los candidatos
+        search_bytes = self._search_bytes
+        results = [
+            self._prompts[prompt_id]
+            for prompt_id in (
+                self._prompts if candidates is None
+                else sorted(candidates, key=self._position.__getitem__)
+            )
+            if not query_bytes or query_bytes in search_bytes[prompt_id]
+        ]
         
         # Ordenar por uso reciente y frecuencia
-        results.sort(key=lambda x: (x.get('use_count', 0), x.get('last_used', '')), reverse=True)
+        results.sort(key=lambda record: (record.use_count, record.last_used or 0), reverse=True)
         
-        return results
+        return [record.to_dict() for record in results]
     
     def get_categories(self) -> List[str]:
         """
         Obtiene todas las categorías disponibles
         
         Returns:
-            Lista de categorías únicas
+            Lista de categorías únicas (memoizada: no debe modificarse)
         """
-        categories = set()
-        for prompt_data in self._prompts.values():
-            categories.add(prompt_data.get('category', 'general'))
-        return sorted(list(categories))
+        self._ensure_loaded()
+        
+        if self._categories_cache is None or self._categories_cache[0] != self._gen:
+            categories = sorted({'general' if category is None else category for category in self._by_category})
+            self._categories_cache = (self._gen, categories)
+        return self._categories_cache[1]
     
     def get_tags(self) -> List[str]:
         """
         Obtiene todas las etiquetas disponibles
         
         Returns:
-            Lista de etiquetas únicas
+            Lista de etiquetas únicas (memoizada: no debe modificarse)
         """
-        tags = set()
-        for prompt_data in self._prompts.values():
-            tags.update(prompt_data.get('tags', []))
-        return sorted(list(tags))
+        self._ensure_loaded()
+        
+        if self._tags_cache is None or self._tags_cache[0] != self._gen:
+            self._tags_cache = (self._gen, sorted(self._by_tag))
+        return self._tags_cache[1]
     
     def get_stats(self) -> Dict[str, Any]:
         """
         Obtiene estadísticas de uso de prompts
         
         Returns:
-            Diccionario con estadísticas
+            Diccionario con estadísticas (memoizado: no debe modificarse)
         """
+        self._ensure_loaded()
+        
+        if self._stats_cache is not None and self._stats_cache[0] == self._gen:
+            return self._stats_cache[1]
+        self._stats_cache = (self._gen, self._compute_stats())
+        return self._stats_cache[1]
+    
+    def _compute_stats(self) -> Dict[str, Any]:
+        """Calcula las estadísticas que devuelve get_stats"""
         if not self._prompts:
             return {
                 "total_prompts": 0,
@@ -256,29 +769,25 @@ class PromptsManager:
                 "recent_used": None
             }
         
-        # Calcular estadísticas
-        total_uses = sum(p.get('use_count', 0) for p in self._prompts.values())
-        
-        # Prompt más usado
-        most_used = max(self._prompts.values(), key=lambda x: x.get('use_count', 0))
+        if self._usage_stale:
+            self._rebuild_usage()
         
-        # Prompt usado más recientemente
-        used_prompts = [p for p in self._prompts.values() if p.get('last_used')]
-        recent_used = max(used_prompts, key=lambda x: x.get('last_used', '')) if used_prompts else None
+        most_used = self._prompts.get(self._most_used_id)
+        recent_used = self._prompts.get(self._recent_used_id)
         
         return {
             "total_prompts": len(self._prompts),
-            "total_uses": total_uses,
+            "total_uses": self._total_uses,
             "categories": len(self.get_categories()),
-            "tags": len(self.get_tags()),
+            "tags": len(self._by_tag),
             "most_used": {
-                "name": most_used.get('name'),
-                "use_count": most_used.get('use_count', 0)
-            } if most_used.get('use_count', 0) > 0 else None,
+                "name": most_used.name,
+                "use_count": most_used.use_count
+            } if most_used is not None else None,
             "recent_used": {
-                "name": recent_used.get('name'),
-                "last_used": recent_used.get('last_used')
-            } if recent_used else None
+                "name": recent_used.name,
+                "last_used": _ns_to_iso(recent_used.last_used)
+            } if recent_used is not None else None
         }
     
     def export_prompts(self, export_path: str, category: str = None):
@@ -289,13 +798,15 @@ class PromptsManager:
             export_path: Ruta donde guardar el archivo
             category: Exportar solo una categoría específica (opcional)
         """
+        self._ensure_loaded()
+        
         if category:
             prompts_to_export = {
-                k: v for k, v in self._prompts.items() 
-                if v.get('category') == category
+                k: v.to_dict() for k, v in self._prompts.items() 
+                if v.category == category
             }
         else:
-            prompts_to_export = self._prompts.copy()
+            prompts_to_export = {k: v.to_dict() for k, v in self._prompts.items()}
         
         export_data = {
             "exported_at": datetime.now().isoformat(),
@@ -305,8 +816,8 @@ class PromptsManager:
             "prompts": prompts_to_export
         }
         
-        with open(export_path, 'w', encoding='utf-8') as f:
-            json.dump(export_data, f, indent=2, ensure_ascii=False)
+        with open(export_path, 'wb') as f:
+            f.write(_dumps(export_data))
     
     def import_prompts(self, import_path: str, overwrite: bool = False) -> Dict[str, Any]:
         """
@@ -319,50 +830,89 @@ class PromptsManager:
         Returns:
             Estadísticas de la importación
         """
-        with open(import_path, 'r', encoding='utf-8') as f:
-            import_data = json.load(f)
+        self._ensure_loaded()
         
-        imported_prompts = import_data.get('prompts', {})
         stats = {
-            "total": len(imported_prompts),
+            "total": 0,
             "imported": 0,
             "skipped": 0,
             "errors": []
         }
         
-        for prompt_data in imported_prompts.values():
+        # Prompts existentes por nombre (el primero con cada nombre)
+        by_name: Dict[str, PromptRecord] = {}
+        for existing_prompt in self._prompts.values():
+            by_name.setdefault(existing_prompt.name, existing_prompt)
+        
+        for prompt_data in self._iter_import_file(import_path):
+            stats["total"] += 1
             try:
+                normalized = self._normalize_import(prompt_data)
+                
                 # Verificar si ya existe un prompt con el mismo nombre
-                existing = None
-                for existing_prompt in self._prompts.values():
-                    if existing_prompt['name'] == prompt_data['name']:
-                        existing = existing_prompt
-                        break
+                existing = by_name.get(normalized['name'])
                 
                 if existing and not overwrite:
                     stats["skipped"] += 1
                     continue
                 
-                # Generar nuevo ID si es necesario
+                # Sin programar escrituras: se guarda todo al final
                 if existing and overwrite:
                     # Actualizar existente
-                    self.update(existing['id'], **{
-                        k: v for k, v in prompt_data.items() 
-                        if k not in ['id', 'created_at', 'use_count']
-                    })
+                    self._apply_updates(existing.id, normalized)
                 else:
                     # Crear nuevo
-                    self.save(
-                        name=prompt_data['name'],
-                        prompt=prompt_data['prompt'],
-                        description=prompt_data.get('description', ''),
-                        category=prompt_data.get('category', 'general'),
-                        tags=prompt_data.get('tags', [])
+                    by_name[normalized['name']] = self._insert(
+                        name=normalized['name'],
+                        prompt=normalized['prompt'],
+                        description=normalized.get('description', ''),
+                        category=normalized.get('category', 'general'),
+                        tags=normalized.get('tags', [])
                     )
                 
                 stats["imported"] += 1
+                self._dirty = True
                 
             except Exception as e:
                 stats["errors"].append(f"Error importing '{prompt_data.get('name', 'unknown')}': {e}")
         
-        return stats
\ No newline at end of file
+        # Una sola escritura para toda la importación
+        self.flush()
+        
+        return stats
+    
+    @staticmethod
+    def _normalize_import(prompt_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Valida un prompt importado y devuelve los campos a aplicar
+        
+        Descarta los campos que no se importan (id, created_at, use_count).
+        
+        Raises:
+            KeyError: Si falta el nombre
+            ValueError: Si el nombre no es un texto
+        """
+        if not isinstance(prompt_data['name'], str):
+            raise ValueError("name must be a string")
+        return {
+            k: v for k, v in prompt_data.items()
+            if k not in ('id', 'created_at', 'use_count')
+        }
+    
+    @staticmethod
+    def _iter_import_file(import_path: str) -> Iterator[Dict[str, Any]]:
+        """
+        Recorre los prompts de un archivo de exportación
+        
+        Los archivos grandes se leen en streaming con ijson (si está
+        instalado), de modo que nunca está el documento entero en memoria;
+        el resto se parsea de una vez.
+        """
+        with open(import_path, 'rb') as f:
+            if ijson is not None and os.fstat(f.fileno()).st_size > _STREAM_IMPORT_THRESHOLD:
+                for _, prompt_data in ijson.kvitems(f, 'prompts', use_float=True):
+                    yield prompt_data
+                return
+            import_data = _loads(f.read())
+        
+        yield from import_data.get('prompts', {}).values()
\ No newline at end of file
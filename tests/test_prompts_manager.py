@@ -0,0 +1,147 @@
+"""
+Tests del almacenamiento de PromptsManager (archivo plano y .zst)
+"""
+
+import os
+
+import pytest
+
+from core import prompts_manager
+from core.prompts_manager import PromptsManager
+
+zstandard = pytest.importorskip("zstandard")
+
+
+def _make_compressed_store(path: str, count: int = 300) -> PromptsManager:
+    """Crea un almacén lo bastante grande para guardarse como .zst"""
+    pm = PromptsManager(path)
+    for i in range(count):
+        pm.save(name=f"prompt {i}", prompt="x" * 400, tags=["t"])
+    pm.flush()
+    assert os.path.exists(pm.compressed_file)
+    assert not os.path.exists(path)
+    return pm
+
+
+def test_compressed_store_survives_missing_zstandard(tmp_path, monkeypatch):
+    path = str(tmp_path / "p.json")
+    _make_compressed_store(path)
+
+    # Sin zstandard el .zst no se puede leer: no se empieza de cero
+    monkeypatch.setattr(prompts_manager, "zstandard", None)
+    pm = PromptsManager(path)
+    with pytest.raises(RuntimeError):
+        pm.get_all()
+    pm.flush()
+    assert not os.path.exists(path)
+
+    # Con zstandard de nuevo se cargan los mismos prompts
+    monkeypatch.setattr(prompts_manager, "zstandard", zstandard)
+    pm = PromptsManager(path)
+    assert len(pm.get_all()) == 300
+
+
+def test_corrupt_compressed_store_is_not_overwritten(tmp_path):
+    path = str(tmp_path / "p.json")
+    pm = _make_compressed_store(path)
+    with open(pm.compressed_file, "wb") as f:
+        f.write(b"not zstd")
+
+    pm = PromptsManager(path)
+    with pytest.raises(RuntimeError):
+        pm.get_all()
+    pm.flush()
+    with open(pm.compressed_file, "rb") as f:
+        assert f.read() == b"not zstd"
+    assert not os.path.exists(path)
+
+
+def test_save_keeps_other_format_it_did_not_load(tmp_path, monkeypatch):
+    path = str(tmp_path / "p.json")
+    pm = _make_compressed_store(path)
+    compressed_before = os.path.getsize(pm.compressed_file)
+
+    # Un archivo plano más reciente se carga, pero el .zst no se borra al
+    # guardar sin comprimir (no es el archivo cargado)
+    monkeypatch.setattr(prompts_manager, "zstandard", None)
+    with open(path, "wb") as f:
+        f.write(b"{}")
+    pm = PromptsManager(path)
+    pm.save(name="nuevo", prompt="y")
+    pm.flush()
+    assert os.path.getsize(pm.compressed_file) == compressed_before
+    assert len(PromptsManager(path).get_all()) == 1
+
+
+def test_plain_store_migrates_to_compressed(tmp_path):
+    path = str(tmp_path / "p.json")
+    pm = PromptsManager(path)
+    pm.save(name="uno", prompt="x")
+    pm.flush()
+    assert os.path.exists(path)
+
+    pm = PromptsManager(path)
+    for i in range(300):
+        pm.save(name=f"prompt {i}", prompt="x" * 400)
+    pm.flush()
+    assert os.path.exists(pm.compressed_file)
+    assert not os.path.exists(path)
+    assert len(PromptsManager(path).get_all()) == 301
+
+
+def test_unknown_fields_are_kept(tmp_path):
+    path = str(tmp_path / "p.json")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"a": {"id": "a", "name": "uno", "prompt": "x", "variables": ["v"]}}')
+
+    pm = PromptsManager(path)
+    assert pm.get("a")["variables"] == ["v"]
+    updated = pm.update("a", description="d", author="yo")
+    assert updated["author"] == "yo"
+    pm.flush()
+
+    prompt = PromptsManager(path).get("a")
+    assert prompt["variables"] == ["v"]
+    assert prompt["author"] == "yo"
+    assert prompt["description"] == "d"
+
+
+def test_import_writes_once(tmp_path, monkeypatch):
+    path = str(tmp_path / "p.json")
+    pm = PromptsManager(path)
+    pm.save(name="uno", prompt="x")
+    pm.flush()
+
+    export_path = str(tmp_path / "export.json")
+    with open(export_path, "w", encoding="utf-8") as f:
+        f.write('{"prompts": {"a": {"name": "uno", "prompt": "y"}, "b": {"name": "dos", "prompt": "z"}}}')
+
+    saves = []
+    save_prompts = pm._save_prompts
+    monkeypatch.setattr(pm, "_save_prompts", lambda prompts: saves.append(1) or save_prompts(prompts))
+    stats = pm.import_prompts(export_path, overwrite=True)
+
+    assert stats["imported"] == 2
+    assert len(saves) == 1
+    assert pm._flush_timer is None
+    prompts = {p["name"]: p["prompt"] for p in PromptsManager(path).get_all().values()}
+    assert prompts == {"uno": "y", "dos": "z"}
+
+
+def test_get_all_refreshes_changed_entries_and_returns_copies(tmp_path):
+    pm = PromptsManager(str(tmp_path / "p.json"))
+    first = pm.save(name="uno", prompt="x", tags=["a"])["id"]
+    second = pm.save(name="dos", prompt="y")["id"]
+
+    before = pm.get_all()
+    before[first]["tags"].append("mutada")
+    pm.mark_used(first)
+    after = pm.get_all()
+
+    assert before[first]["use_count"] == 0
+    assert after[first]["use_count"] == 1
+    assert after[first]["tags"] == ["a"]
+    assert pm.get_stats()["total_uses"] == 1
+
+    pm.delete(second)
+    assert list(pm.get_all()) == [first]